@@ -1,16 +1,106 @@
-from fastapi import Depends, HTTPException, status, Request
+import hashlib
+import os
+import secrets
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from cachetools import LRUCache, TLRUCache
+from fastapi import HTTPException, status, Request
 import firebase_admin
 from firebase_admin import auth, credentials
 from db import crud
-from db.database import get_db
-from sqlalchemy.orm import Session
+from db.database import SessionLocal
 
 if not firebase_admin._apps:
     cred = credentials.Certificate("serviceAccountKey.json")
     firebase_admin.initialize_app(cred)
 
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+# Bearer token for the operational endpoints (/metrics); unset disables them
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-async def get_current_user(request: Request, db: Session = Depends(get_db)):
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """Session-independent snapshot of a User row, safe to cache across
+    requests (ORM instances are bound to the session that loaded them)."""
+
+    id: uuid.UUID
+    firebase_uid: str
+    name: str
+
+
+# Verified token claims keyed by token hash, each entry expiring at the
+# token's own `exp` claim so a cached token is never honoured past expiry.
+_token_cache = TLRUCache(
+    maxsize=TOKEN_CACHE_SIZE,
+    ttu=lambda _key, claims, _now: claims.get("exp", 0),
+    timer=time.time,
+)
+_user_cache = LRUCache(maxsize=USER_CACHE_SIZE)
+_cache_lock = threading.Lock()
+_cache_stats = {"token_hits": 0, "token_misses": 0, "user_hits": 0, "user_misses": 0}
+
+
+def _cache_get(cache, key, stat: str):
+    with _cache_lock:
+        value = cache.get(key)
+        _cache_stats[f"{stat}_hits" if value is not None else f"{stat}_misses"] += 1
+        return value
+
+
+def _cache_set(cache, key, value):
+    with _cache_lock:
+        cache[key] = value
+
+
+def _hit_rate(hits: int, misses: int) -> float | None:
+    return hits / (hits + misses) if hits + misses else None
+
+
+def get_auth_cache_stats() -> dict:
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["token_cache_size"] = len(_token_cache)
+        stats["user_cache_size"] = len(_user_cache)
+    stats["token_hit_rate"] = _hit_rate(stats["token_hits"], stats["token_misses"])
+    stats["user_hit_rate"] = _hit_rate(stats["user_hits"], stats["user_misses"])
+    return stats
+
+
+def _verify_token(id_token: str) -> dict:
+    token_key = hashlib.sha256(id_token.encode()).hexdigest()
+    claims = _cache_get(_token_cache, token_key, "token")
+    if claims is None:
+        claims = auth.verify_id_token(id_token)
+        _cache_set(_token_cache, token_key, claims)
+    return claims
+
+
+def _load_user(uid: str, name: str) -> AuthenticatedUser | None:
+    user = _cache_get(_user_cache, uid, "user")
+    if user is None:
+        # A session of its own, closed before the route runs, rather than
+        # the request's get_db session, which would otherwise keep its
+        # connection checked out for the whole request.
+        with SessionLocal() as db:
+            db_user = crud.get_user_by_firebase_uid(db, uid)
+            if not db_user:
+                db_user = crud.create_user(db, uid, name)
+            if not db_user:
+                return None
+            user = AuthenticatedUser(
+                id=db_user.id, firebase_uid=db_user.firebase_uid, name=db_user.name
+            )
+        _cache_set(_user_cache, uid, user)
+    return user
+
+
+def get_current_user(request: Request):
+    # Plain def: FastAPI runs it in the threadpool, since token verification
+    # may fetch Google's signing keys and a cache miss queries the database.
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(
@@ -18,15 +108,13 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)):
         )
     id_token = auth_header.split(" ")[1]
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = _verify_token(id_token)
         uid = decoded_token.get("uid")
         if not uid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
             )
-        user = crud.get_user_by_firebase_uid(db, uid)
-        if not user:
-            user = crud.create_user(db, uid, decoded_token.get("name", ""))
+        user = _load_user(uid, decoded_token.get("name", ""))
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
@@ -37,3 +125,17 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
         )
+
+
+def require_metrics_token(request: Request):
+    # Not found rather than unauthorized when disabled, so the endpoint's
+    # existence is not advertised
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    auth_header = request.headers.get("Authorization", "")
+    if not secrets.compare_digest(
+        auth_header.encode(), f"Bearer {METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token"
+        )
@@ -1,57 +1,79 @@
 import uuid
 from datetime import datetime, timezone, timedelta
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
-from db.models import FlashcardReview, FlashcardStats
+from db import crud
+from db.models import Flashcard, FlashcardReview, FlashcardStats
+from db.schemas import FlashcardStatsSchema
 
 # SM-2 algorithm constants
 MIN_EASE = 1.3
 MAX_EASE = 2.5
 DEFAULT_EASE = 2.5
 
+# Smoothing factor for the exponentially weighted miss rate
+EWMA_ALPHA = 0.2
 
-def update_flashcard_stats_from_reviews(db: Session, flashcard_id: uuid.UUID):
-    reviews = (
-        db.query(FlashcardReview)
-        .filter(FlashcardReview.flashcard_id == flashcard_id)
-        .order_by(FlashcardReview.timestamp.asc())
-        .all()
+
+def _sm2_step(ease: float, interval: int, grade: int, first_review: bool):
+    # SM-2 algorithm https://en.wikipedia.org/wiki/SuperMemo
+    if first_review or grade < 3:
+        interval = 1
+    else:
+        interval = int(interval * ease)
+    ease = max(
+        MIN_EASE,
+        min(MAX_EASE, ease + (0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))),
     )
-    if not reviews:
-        # If no reviews, delete stats if exists
-        stats = (
-            db.query(FlashcardStats)
-            .filter(FlashcardStats.flashcard_id == flashcard_id)
-            .first()
-        )
-        if stats:
-            db.delete(stats)
-            db.commit()
-        return None
+    return ease, interval
 
-    correct_count = sum(1 for r in reviews if r.grade >= 4)
-    wrong_count = sum(1 for r in reviews if r.grade < 4)
-    last_seen = reviews[-1].timestamp
 
-    # SM-2 algorithm https://en.wikipedia.org/wiki/SuperMemo
-    ease = DEFAULT_EASE
-    interval = 1
-    due_date = last_seen.date() + timedelta(days=interval)
-    for idx, r in enumerate(reviews):
-        q = r.grade
-        if idx == 0:
-            interval = 1
-        else:
-            if q < 3:
-                interval = 1
-            else:
-                interval = int(interval * ease)
-        ease = max(
-            MIN_EASE, min(MAX_EASE, ease + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02)))
-        )
-        due_date = r.timestamp.date() + timedelta(days=interval)
+def _due_date(reviewed_at: datetime, interval: int) -> datetime:
+    due = reviewed_at.date() + timedelta(days=interval)
+    return datetime.combine(due, datetime.min.time(), tzinfo=timezone.utc)
 
-    due_date = datetime.combine(due_date, datetime.min.time(), tzinfo=timezone.utc)
 
+def apply_review_to_stats(stats: FlashcardStats, grade: int, reviewed_at: datetime):
+    """Advance SM-2 state by a single review that is newer than every review
+    already folded into `stats`. Does not touch the database."""
+    first_review = (stats.correct_count or 0) + (stats.wrong_count or 0) == 0
+    stats.ease, stats.interval_days = _sm2_step(
+        stats.ease if stats.ease is not None else DEFAULT_EASE,
+        stats.interval_days or 1,
+        grade,
+        first_review,
+    )
+    if grade >= 4:
+        stats.correct_count = (stats.correct_count or 0) + 1
+    else:
+        stats.wrong_count = (stats.wrong_count or 0) + 1
+    stats.last_seen = reviewed_at
+    stats.due_date = _due_date(reviewed_at, stats.interval_days)
+    return stats
+
+
+def record_review(
+    db: Session, flashcard_id: uuid.UUID, grade: int, latency_ms: int
+) -> FlashcardReview:
+    """Insert a review made now and advance the card's stats, in one
+    transaction. Ownership must already have been checked by the caller."""
+    review = FlashcardReview(
+        flashcard_id=flashcard_id,
+        grade=grade,
+        latency_ms=latency_ms,
+        timestamp=datetime.now(timezone.utc),
+    )
+    db.add(review)
+    update_flashcard_stats_incremental(db, flashcard_id, grade, review.timestamp)
+    db.refresh(review)
+    return review
+
+
+def update_flashcard_stats_incremental(
+    db: Session, flashcard_id: uuid.UUID, grade: int, reviewed_at: datetime
+):
+    """Advance SM-2 and EWMA stats by one review and commit, along with
+    anything else pending in the session such as the review itself."""
     stats = (
         db.query(FlashcardStats)
         .filter(FlashcardStats.flashcard_id == flashcard_id)
@@ -60,64 +82,140 @@ def update_flashcard_stats_from_reviews(db: Session, flashcard_id: uuid.UUID):
     if not stats:
         stats = FlashcardStats(
             flashcard_id=flashcard_id,
-            correct_count=correct_count,
-            wrong_count=wrong_count,
-            last_seen=last_seen,
-            ease=ease,
-            interval_days=interval,
-            due_date=due_date,
+            correct_count=0,
+            wrong_count=0,
+            ease=DEFAULT_EASE,
+            interval_days=1,
         )
         db.add(stats)
-    else:
-        stats.correct_count = correct_count
-        stats.wrong_count = wrong_count
-        stats.last_seen = last_seen
-        stats.ease = ease
-        stats.interval_days = interval
-        stats.due_date = due_date
+    elif stats.last_seen and reviewed_at < stats.last_seen:
+        # A review older than the current state cannot be applied on top of
+        # it, so fall back to replaying the history in timestamp order.
+        return rebuild_flashcard_stats(db, flashcard_id)
+
+    apply_review_to_stats(stats, grade, reviewed_at)
+    stats.ewma_miss = _ewma_step(stats.ewma_miss, grade < 4)
+    crud.refresh_topic_mastery(db, _topic_ids([flashcard_id]))
     db.commit()
     db.refresh(stats)
     return stats
 
 
-def update_ewma_miss(
-    db: Session, flashcard_id: uuid.UUID, is_miss: bool, alpha: float = 0.2
-):
-    print("looking at ewma for ", flashcard_id)
+def rebuild_flashcard_stats(db: Session, flashcard_id: uuid.UUID):
+    """Recompute stats from the full review history. Only needed when the
+    history changes other than by appending, e.g. after a review is deleted."""
+    db.flush()
+    reviews = (
+        db.query(FlashcardReview)
+        .filter(FlashcardReview.flashcard_id == flashcard_id)
+        .order_by(FlashcardReview.timestamp.asc())
+        .all()
+    )
     stats = (
         db.query(FlashcardStats)
         .filter(FlashcardStats.flashcard_id == flashcard_id)
         .first()
     )
+    if not reviews:
+        # If no reviews, delete stats if exists
+        if stats:
+            db.delete(stats)
+            crud.refresh_topic_mastery(db, _topic_ids([flashcard_id]))
+            db.commit()
+        return None
+
     if not stats:
-        stats = FlashcardStats(
-            flashcard_id=flashcard_id, ewma_miss=1.0 if is_miss else 0.0
-        )
+        stats = FlashcardStats(flashcard_id=flashcard_id)
         db.add(stats)
-        db.commit()
-        db.refresh(stats)
-        print("updated ewma_miss ", stats.ewma_miss)
-        return stats
+    _replay_reviews(stats, reviews)
+    crud.refresh_topic_mastery(db, _topic_ids([flashcard_id]))
+    db.commit()
+    db.refresh(stats)
+    return stats
 
-    attempts = (
-        db.query(FlashcardReview)
-        .filter(FlashcardReview.flashcard_id == flashcard_id)
-        .count()
-    )
-    if stats.correct_count + stats.wrong_count >= attempts:
-        return stats
 
-    old_ewma = stats.ewma_miss
-    print(stats.wrong_count, stats.correct_count, attempts)
+def _replay_reviews(stats: FlashcardStats, reviews: list[FlashcardReview]):
+    stats.correct_count = 0
+    stats.wrong_count = 0
+    stats.ease = DEFAULT_EASE
+    stats.interval_days = 1
+    stats.ewma_miss = None
+    for r in reviews:
+        apply_review_to_stats(stats, r.grade, r.timestamp)
+        stats.ewma_miss = _ewma_step(stats.ewma_miss, r.grade < 4)
+
+
+def _topic_ids(flashcard_ids):
+    return select(Flashcard.topic_id).where(Flashcard.id.in_(flashcard_ids))
+
+
+def _ewma_step(old_ewma: float | None, is_miss: bool, alpha: float = EWMA_ALPHA):
     if old_ewma is None:
-        print("no old")
-        new_ewma = 1.0 if is_miss else 0.0
-        stats.ewma_miss = new_ewma
-    else:
-        print("existing old", old_ewma)
-        new_ewma = alpha * (1 if is_miss else 0) + (1 - alpha) * old_ewma
-        stats.ewma_miss = new_ewma
+        return 1.0 if is_miss else 0.0
+    return alpha * (1 if is_miss else 0) + (1 - alpha) * old_ewma
+
+
+def record_reviews_bulk(db: Session, reviews: list[dict]) -> list[FlashcardStatsSchema]:
+    """Insert a batch of reviews and advance SM-2 and EWMA stats for every
+    affected card, all in one transaction. Each review is a dict with
+    flashcard_id, grade, latency_ms and timestamp. Ownership must already
+    have been checked by the caller."""
+    if not reviews:
+        return []
+    reviews = sorted(reviews, key=lambda r: (r["flashcard_id"], r["timestamp"]))
+    db.execute(insert(FlashcardReview), reviews)
+
+    flashcard_ids = {r["flashcard_id"] for r in reviews}
+    stats_by_card = {
+        stats.flashcard_id: stats
+        for stats in db.query(FlashcardStats).filter(
+            FlashcardStats.flashcard_id.in_(flashcard_ids)
+        )
+    }
+
+    # Cards whose new reviews predate their current state are replayed from
+    # the full history; everything else is advanced incrementally.
+    replay_ids = set()
+    for r in reviews:
+        stats = stats_by_card.get(r["flashcard_id"])
+        if stats and stats.last_seen and r["timestamp"] < stats.last_seen:
+            replay_ids.add(r["flashcard_id"])
+
+    history = {}
+    if replay_ids:
+        for r in (
+            db.query(FlashcardReview)
+            .filter(FlashcardReview.flashcard_id.in_(replay_ids))
+            .order_by(FlashcardReview.timestamp.asc())
+        ):
+            history.setdefault(r.flashcard_id, []).append(r)
+
+    for r in reviews:
+        flashcard_id = r["flashcard_id"]
+        if flashcard_id in replay_ids:
+            continue
+        stats = stats_by_card.get(flashcard_id)
+        if not stats:
+            stats = FlashcardStats(
+                flashcard_id=flashcard_id,
+                correct_count=0,
+                wrong_count=0,
+                ease=DEFAULT_EASE,
+                interval_days=1,
+            )
+            db.add(stats)
+            stats_by_card[flashcard_id] = stats
+        apply_review_to_stats(stats, r["grade"], r["timestamp"])
+        stats.ewma_miss = _ewma_step(stats.ewma_miss, r["grade"] < 4)
+
+    for flashcard_id in replay_ids:
+        _replay_reviews(stats_by_card[flashcard_id], history[flashcard_id])
+
+    crud.refresh_topic_mastery(db, _topic_ids(flashcard_ids))
+    # Serialize before committing: commit expires the rows, and reading them
+    # back afterwards would cost one SELECT per card
+    results = [
+        FlashcardStatsSchema.model_validate(stats) for stats in stats_by_card.values()
+    ]
     db.commit()
-    db.refresh(stats)
-    print("updated ewma_miss ", stats.ewma_miss)
-    return stats
+    return results
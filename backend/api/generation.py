@@ -0,0 +1,278 @@
+import asyncio
+import os
+import uuid
+from starlette.concurrency import run_in_threadpool
+from api.llm import (
+    create_multiple_choice_exam,
+    extract_flashcards,
+    extract_topics,
+    infer_topic_dependencies,
+)
+from db import crud
+from db.database import SessionLocal
+from db.schemas import ExamSchema, FlashcardSchema, TopicSchema
+
+# LLM-backed generation shared by the synchronous routes and background jobs.
+# Lookups raise ValueError when something is missing or not owned, like crud;
+# GenerationError means the model's output could not be used.
+#
+# LLM calls take seconds, so no database session is held across them: each
+# function reads what the prompt needs in one short session, awaits the model
+# with no connection checked out, then writes the results in a second session.
+# The sessions are blocking, so they run in the threadpool (the _load/_save
+# helpers) to keep the event loop free. Results are returned as schemas since
+# ORM rows do not outlive their session.
+
+# Max extract_flashcards calls in flight for one stack-level generation
+FLASHCARD_GENERATION_CONCURRENCY = int(
+    os.getenv("FLASHCARD_GENERATION_CONCURRENCY", "4")
+)
+
+
+class GenerationError(Exception):
+    pass
+
+
+def _to_schemas(schema, rows) -> list:
+    return [schema.model_validate(row) for row in rows]
+
+
+def _topic_names(db, stack_id: uuid.UUID, user_id: uuid.UUID) -> list[str]:
+    return [
+        t.name
+        for t in crud.get_topics_by_stack_id(
+            db, stack_id, user_id, load_relations=False
+        )
+    ]
+
+
+def _load_stack_prompt(stack_id: uuid.UUID, user_id: uuid.UUID):
+    with SessionLocal() as db:
+        stack = crud.get_stack_by_id(db, stack_id, user_id)
+        return stack.name, stack.description, _topic_names(db, stack_id, user_id)
+
+
+def _save_topics(stack_id: uuid.UUID, user_id: uuid.UUID, topics: dict[str, str]):
+    with SessionLocal() as db:
+        for name, description in topics.items():
+            crud.create_topic(db, stack_id, name, description, user_id)
+        return _to_schemas(
+            TopicSchema,
+            crud.get_topics_with_prerequisites_by_stack_id(db, stack_id, user_id),
+        )
+
+
+async def generate_topics(stack_id: uuid.UUID, user_id: uuid.UUID):
+    stack_name, stack_description, avoid_topics = await run_in_threadpool(
+        _load_stack_prompt, stack_id, user_id
+    )
+    topics = await extract_topics(stack_name, stack_description, avoid_topics)
+    if "topics" not in topics:
+        print(topics)
+        raise GenerationError("Failed to generate topics")
+    return await run_in_threadpool(_save_topics, stack_id, user_id, topics["topics"])
+
+
+def _load_topic_names(stack_id: uuid.UUID, user_id: uuid.UUID) -> list[str]:
+    with SessionLocal() as db:
+        return _topic_names(db, stack_id, user_id)
+
+
+def _save_dependencies(
+    stack_id: uuid.UUID, user_id: uuid.UUID, dependencies: list[list[str]]
+):
+    with SessionLocal() as db:
+        crud.add_topic_dependencies_by_name(db, stack_id, user_id, dependencies)
+        return _to_schemas(
+            TopicSchema,
+            crud.get_topics_with_prerequisites_by_stack_id(db, stack_id, user_id),
+        )
+
+
+async def infer_dependencies(stack_id: uuid.UUID, user_id: uuid.UUID):
+    topic_names = await run_in_threadpool(_load_topic_names, stack_id, user_id)
+    if not topic_names:
+        raise ValueError("Stack not found or has no topics")
+    dependencies = await infer_topic_dependencies(topic_names)
+    return await run_in_threadpool(_save_dependencies, stack_id, user_id, dependencies)
+
+
+def _load_topic_prompt(topic_id: uuid.UUID, user_id: uuid.UUID):
+    with SessionLocal() as db:
+        topic = crud.get_topic_by_id(db, topic_id, user_id)
+        fronts = [
+            c.front for c in crud.get_flashcards_by_topic_id(db, topic_id, user_id)
+        ]
+        return topic.name, fronts
+
+
+def _is_complete_card(card) -> bool:
+    return isinstance(card, dict) and all(
+        key in card for key in ("front", "back", "explanation")
+    )
+
+
+def _save_flashcards(topic_id: uuid.UUID, user_id: uuid.UUID, flashcards: list[dict]):
+    # Ids are assigned here so the cards need not be read back after the
+    # single bulk insert
+    cards = [
+        {
+            "id": uuid.uuid4(),
+            "topic_id": topic_id,
+            "front": card["front"],
+            "back": card["back"],
+            "explanation": card["explanation"],
+        }
+        for card in flashcards
+        if _is_complete_card(card)
+    ]
+    with SessionLocal() as db:
+        crud.get_topic_by_id(db, topic_id, user_id)
+        crud.insert_flashcards(db, cards)
+    return [FlashcardSchema(**card) for card in cards]
+
+
+async def generate_flashcards(topic_id: uuid.UUID, user_id: uuid.UUID):
+    topic_name, avoid_fronts = await run_in_threadpool(
+        _load_topic_prompt, topic_id, user_id
+    )
+    try:
+        flashcards = await extract_flashcards(topic_name, avoid_fronts=avoid_fronts)
+    except ValueError as e:
+        raise GenerationError(str(e))
+    return await run_in_threadpool(_save_flashcards, topic_id, user_id, flashcards)
+
+
+def _load_stack_topics(stack_id: uuid.UUID, user_id: uuid.UUID):
+    with SessionLocal() as db:
+        topics = [
+            (t.id, t.name)
+            for t in crud.get_topics_by_stack_id(
+                db, stack_id, user_id, load_relations=False
+            )
+        ]
+        return topics, crud.get_flashcard_fronts_by_stack_id(db, stack_id, user_id)
+
+
+def _insert_flashcards(cards: list[dict]):
+    with SessionLocal() as db:
+        crud.insert_flashcards(db, cards)
+
+
+async def generate_stack_flashcards(
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    topic_ids: list[uuid.UUID] | None = None,
+    num_cards: int = 10,
+) -> list[dict]:
+    """Generate cards for many topics of a stack concurrently. A failure for one
+    topic is reported in its result rather than failing the whole stack."""
+    topics, existing_fronts = await run_in_threadpool(
+        _load_stack_topics, stack_id, user_id
+    )
+    if topic_ids is not None:
+        requested = set(topic_ids)
+        topics = [t for t in topics if t[0] in requested]
+        if len(topics) != len(requested):
+            raise ValueError("Topic not found or does not belong to stack")
+
+    slots = asyncio.Semaphore(FLASHCARD_GENERATION_CONCURRENCY)
+
+    async def generate(topic_id, topic_name):
+        async with slots:
+            return await extract_flashcards(
+                topic_name,
+                num_cards=num_cards,
+                avoid_fronts=existing_fronts.get(topic_id, []),
+            )
+
+    generated = await asyncio.gather(
+        *(generate(*topic) for topic in topics), return_exceptions=True
+    )
+
+    results = []
+    new_cards = []
+    for (topic_id, topic_name), cards in zip(topics, generated):
+        result = {"topic_id": topic_id, "topic_name": topic_name, "created": 0}
+        if isinstance(cards, Exception):
+            result["error"] = str(cards)
+            results.append(result)
+            continue
+        topic_cards = [
+            {
+                "topic_id": topic_id,
+                "front": card["front"],
+                "back": card["back"],
+                "explanation": card["explanation"],
+            }
+            for card in cards
+            # Incomplete cards are skipped, as for single-topic generation
+            if _is_complete_card(card)
+        ]
+        new_cards.extend(topic_cards)
+        result["created"] = len(topic_cards)
+        results.append(result)
+
+    await run_in_threadpool(_insert_flashcards, new_cards)
+    return results
+
+
+def _check_stack(stack_id: uuid.UUID, user_id: uuid.UUID):
+    with SessionLocal() as db:
+        crud.get_stack_by_id(db, stack_id, user_id)
+
+
+def _parse_exam_questions(questions: list[dict]) -> list[dict]:
+    """Validate the whole generated exam before anything is written, so a
+    malformed question fails the exam instead of leaving it half-saved."""
+    parsed = []
+    for number, question in enumerate(questions, 1):
+        choices = question.get("choices")
+        answer = str(question.get("answer", "")).strip().upper()
+        if (
+            not isinstance(question.get("text"), str)
+            or not question["text"].strip()
+            or not isinstance(choices, dict)
+            or not all(isinstance(choices.get(letter), str) for letter in "ABCD")
+            or answer not in ("A", "B", "C", "D")
+        ):
+            raise GenerationError(f"Generated exam question {number} is malformed")
+        parsed.append(
+            {
+                "text": question["text"],
+                "option_a": choices["A"],
+                "option_b": choices["B"],
+                "option_c": choices["C"],
+                "option_d": choices["D"],
+                "answer": answer,
+                "topic_name": question.get("topic_name"),
+            }
+        )
+    return parsed
+
+
+def _save_exam(
+    stack_id: uuid.UUID, user_id: uuid.UUID, title: str, questions: list[dict]
+):
+    with SessionLocal() as db:
+        exam = crud.create_exam_with_questions(db, stack_id, title, questions, user_id)
+        return ExamSchema.model_validate(exam)
+
+
+async def generate_exam(
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    title: str,
+    prompt: str,
+    num_questions: int,
+    topics: list[str],
+):
+    # Check ownership before spending an LLM call on the exam
+    await run_in_threadpool(_check_stack, stack_id, user_id)
+    generated_exam = await create_multiple_choice_exam(
+        title, topics, num_questions, prompt
+    )
+    if not generated_exam:
+        raise GenerationError("Failed to generate exam")
+    questions = _parse_exam_questions(generated_exam)
+    return await run_in_threadpool(_save_exam, stack_id, user_id, title, questions)
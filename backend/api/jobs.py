@@ -0,0 +1,187 @@
+import asyncio
+import math
+import os
+import threading
+import uuid
+import weakref
+from datetime import datetime, timedelta, timezone
+from api import generation
+from db import crud
+from db.database import SessionLocal
+from db.schemas import GenerationJobSchema
+from starlette.concurrency import run_in_threadpool
+
+# In-process background jobs for slow LLM generation. The request that enqueues
+# a job returns its id straight away; the work runs as an asyncio task on the
+# same event loop and its state and result are kept in generation_jobs so any
+# worker can answer status polls.
+
+# Jobs of one user that may run at once; further jobs wait their turn
+JOB_MAX_CONCURRENT_PER_USER = int(os.getenv("JOB_MAX_CONCURRENT_PER_USER", "2"))
+# Jobs of one user that may be queued or running before new ones are refused
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", "10"))
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "600"))
+# Slack before another worker's job counts as lost, so that its owner gets to
+# record the outcome of a job that timed out
+JOB_STALE_GRACE_SECONDS = 60
+
+
+class TooManyJobsError(Exception):
+    pass
+
+
+_handlers = {}
+# Strong references to running tasks, which asyncio only holds weakly
+_tasks = set()
+# Per-user slots; an entry disappears once none of that user's jobs hold it
+_user_slots = weakref.WeakValueDictionary()
+# Ids of jobs this process has queued or is running. Updated on the event loop
+# and read from the threadpool, hence the lock.
+_local_jobs = set()
+_local_jobs_lock = threading.Lock()
+
+
+def job_handler(kind: str):
+    """Register `func(user_id, params)` as the handler for jobs of `kind`.
+    It must return a JSON-serializable result."""
+
+    def register(func):
+        _handlers[kind] = func
+        return func
+
+    return register
+
+
+def _fail_stale_jobs(db, user_id: uuid.UUID | None = None) -> int:
+    """Fail jobs whose worker must have died. A running job is finished by its
+    own timeout, so one running for longer is lost. A queued job waits for at
+    most every other active job of its user to run, JOB_MAX_CONCURRENT_PER_USER
+    at a time. Jobs owned by this process are never touched."""
+    now = datetime.now(timezone.utc)
+    max_queue_wait = JOB_TIMEOUT_SECONDS * math.ceil(
+        JOB_MAX_ACTIVE_PER_USER / JOB_MAX_CONCURRENT_PER_USER
+    )
+    with _local_jobs_lock:
+        local_jobs = list(_local_jobs)
+    return crud.fail_stale_jobs(
+        db,
+        started_before=now
+        - timedelta(seconds=JOB_TIMEOUT_SECONDS + JOB_STALE_GRACE_SECONDS),
+        queued_before=now - timedelta(seconds=max_queue_wait + JOB_STALE_GRACE_SECONDS),
+        user_id=user_id,
+        exclude_ids=local_jobs,
+    )
+
+
+def fail_stale_jobs(user_id: uuid.UUID | None = None) -> int:
+    with SessionLocal() as db:
+        return _fail_stale_jobs(db, user_id)
+
+
+def create_job(db, user_id: uuid.UUID, kind: str, params: dict):
+    """Record a queued job. Synchronous, so callers can run it in the
+    threadpool; start_job must then be called from the event loop."""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    _fail_stale_jobs(db, user_id)
+    job = crud.create_job(db, user_id, kind, params, max_active=JOB_MAX_ACTIVE_PER_USER)
+    if job is None:
+        raise TooManyJobsError("Too many generation jobs in progress")
+    return GenerationJobSchema.model_validate(job)
+
+
+def start_job(job: GenerationJobSchema, user_id: uuid.UUID, params: dict):
+    with _local_jobs_lock:
+        _local_jobs.add(job.id)
+    task = asyncio.create_task(_run_job(job.id, user_id, job.kind, params))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def _slots_for(user_id: uuid.UUID) -> asyncio.Semaphore:
+    slots = _user_slots.get(user_id)
+    if slots is None:
+        slots = asyncio.Semaphore(JOB_MAX_CONCURRENT_PER_USER)
+        _user_slots[user_id] = slots
+    return slots
+
+
+async def _run_job(job_id: uuid.UUID, user_id: uuid.UUID, kind: str, params: dict):
+    try:
+        async with _slots_for(user_id):
+            if not await run_in_threadpool(_mark_running, job_id):
+                print(f"Job {job_id} ({kind}) was finalized before it started")
+                return
+            # Handlers open their own short sessions around the LLM call
+            result, error = None, None
+            try:
+                result = await asyncio.wait_for(
+                    _handlers[kind](user_id, params), JOB_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                error = "Job timed out"
+            except Exception as e:
+                print(f"Job {job_id} ({kind}) failed:", e)
+                error = str(e) or type(e).__name__
+            if not await run_in_threadpool(_finish, job_id, result, error):
+                print(f"Job {job_id} ({kind}) was finalized before it finished")
+    finally:
+        with _local_jobs_lock:
+            _local_jobs.discard(job_id)
+
+
+def _mark_running(job_id: uuid.UUID) -> bool:
+    with SessionLocal() as db:
+        return crud.mark_job_running(db, job_id)
+
+
+def _finish(job_id: uuid.UUID, result, error: str | None) -> bool:
+    with SessionLocal() as db:
+        return crud.finish_job(db, job_id, result=result, error=error)
+
+
+def _dump(rows) -> list:
+    return [row.model_dump(mode="json") for row in rows]
+
+
+@job_handler("generate_topics")
+async def _generate_topics(user_id, params):
+    topics = await generation.generate_topics(uuid.UUID(params["stack_id"]), user_id)
+    return _dump(topics)
+
+
+@job_handler("infer_dependencies")
+async def _infer_dependencies(user_id, params):
+    topics = await generation.infer_dependencies(uuid.UUID(params["stack_id"]), user_id)
+    return _dump(topics)
+
+
+@job_handler("generate_flashcards")
+async def _generate_flashcards(user_id, params):
+    cards = await generation.generate_flashcards(uuid.UUID(params["topic_id"]), user_id)
+    return _dump(cards)
+
+
+@job_handler("generate_stack_flashcards")
+async def _generate_stack_flashcards(user_id, params):
+    topic_ids = params.get("topic_ids")
+    results = await generation.generate_stack_flashcards(
+        uuid.UUID(params["stack_id"]),
+        user_id,
+        topic_ids=[uuid.UUID(t) for t in topic_ids] if topic_ids is not None else None,
+        num_cards=params.get("num_cards", 10),
+    )
+    return [{**r, "topic_id": str(r["topic_id"])} for r in results]
+
+
+@job_handler("generate_exam")
+async def _generate_exam(user_id, params):
+    exam = await generation.generate_exam(
+        uuid.UUID(params["stack_id"]),
+        user_id,
+        params["title"],
+        params["prompt"],
+        params["num_questions"],
+        params["topics"],
+    )
+    return exam.model_dump(mode="json")
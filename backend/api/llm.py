@@ -1,15 +1,90 @@
+import asyncio
 import httpx
 import os
 import json
-from typing import List
+from typing import AsyncIterator, List
+from api.llm_cache import cache_key, llm_cache
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+OPENROUTER_READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "120"))
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "10"))
 model = "openai/gpt-4o-mini"  # "anthropic/claude-3-haiku" # "z-ai/glm-4.5-air:free"  # "google/gemini-2.0-flash-exp:free" #  # "openai/gpt-3.5-turbo" "openai/gpt-oss-20b:free"
 temperature = 0.2
 
+# One pooled client for the lifetime of the app (see lifespan in main.py), so
+# calls reuse keep-alive HTTP/2 connections instead of paying a fresh TCP+TLS
+# handshake each time.
+_client: httpx.AsyncClient | None = None
+_request_slots = asyncio.Semaphore(OPENROUTER_MAX_CONCURRENCY)
+
+
+def _create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=True,
+        headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}"},
+        timeout=httpx.Timeout(
+            OPENROUTER_READ_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT
+        ),
+        limits=httpx.Limits(
+            max_connections=OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS,
+        ),
+    )
+
+
+async def start_client():
+    global _client
+    if _client is None:
+        _client = _create_client()
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # Created lazily as well so the helpers also work outside the app lifespan
+    global _client
+    if _client is None:
+        _client = _create_client()
+    return _client
+
+
+async def _post_completion(payload: dict) -> httpx.Response:
+    async with _request_slots:
+        return await get_client().post(OPENROUTER_URL, json=payload)
+
+
+async def _completion_body(payload: dict, use_cache: bool = False) -> dict:
+    """Response body for `payload`. With `use_cache`, served from llm_cache
+    when an identical request has succeeded before; callers that then fail to
+    parse the body should discard it so a bad completion is not served again."""
+    key = cache_key(payload) if use_cache else None
+    if key:
+        body = await llm_cache.get(key)
+        if body is not None:
+            return body
+    response = await _post_completion(payload)
+    try:
+        body = response.json()
+    except ValueError:
+        return {"error": response.text}
+    if key and response.status_code == 200 and body.get("choices"):
+        await llm_cache.set(key, body)
+    return body
+
 
 async def extract_topics(
-    subject: str, description: str | None, avoid_topics: List[str] = []
+    subject: str,
+    description: str | None,
+    avoid_topics: List[str] = [],
+    use_cache: bool = True,
 ) -> dict:
     prompt = (
         f"Subject: {subject}\n"
@@ -23,29 +98,16 @@ async def extract_topics(
         + "\n\n"
     )
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-    }
-
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": temperature,
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            json=payload,
-            headers=headers,
-        )
+    body = await _completion_body(payload, use_cache)
 
     try:
-        content = (
-            response.json()["choices"][0]["message"]["content"]
-            .strip()
-            .replace("'", '"')
-        )
+        content = body["choices"][0]["message"]["content"].strip().replace("'", '"')
         if not content.startswith("{") or not content.endswith("}"):
             start = content.find("{")
             end = content.rfind("}")
@@ -56,10 +118,14 @@ async def extract_topics(
         topics_with_descriptions = json.loads(content)
         return {"topics": topics_with_descriptions}
     except Exception as e:
-        return {"error": str(e), "raw_output": response.text}
+        if use_cache:
+            await llm_cache.discard(cache_key(payload))
+        return {"error": str(e), "raw_output": json.dumps(body)}
 
 
-async def infer_topic_dependencies(topics: List[str]) -> List[List[str]]:
+async def infer_topic_dependencies(
+    topics: List[str], use_cache: bool = True
+) -> List[List[str]]:
     prompt = (
         f"Given the following list of topics:\n\n"
         f"{topics}\n\n"
@@ -69,10 +135,6 @@ async def infer_topic_dependencies(topics: List[str]) -> List[List[str]]:
         "Only include edges you are confident in. Do not invent new topics. Do not explain anything. Do not create circular dependencies."
     )
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-    }
-
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
@@ -81,15 +143,10 @@ async def infer_topic_dependencies(topics: List[str]) -> List[List[str]]:
 
     print("Attempting to infer dependencies:")
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            json=payload,
-            headers=headers,
-        )
+    body = await _completion_body(payload, use_cache)
 
     try:
-        content = response.json()["choices"][0]["message"]["content"]
+        content = body["choices"][0]["message"]["content"]
         if not content.startswith("[") or not content.endswith("]"):
             start = content.find("[")
             end = content.rfind("]")
@@ -105,6 +162,8 @@ async def infer_topic_dependencies(topics: List[str]) -> List[List[str]]:
             raise ValueError("Unexpected format")
     except Exception as e:
         print("Error parsing response:", e)
+        if use_cache:
+            await llm_cache.discard(cache_key(payload))
         return []
 
 
@@ -134,10 +193,6 @@ async def extract_flashcards(
         f"{avoid_text}"
         f"{f'Consider the following context if relevant but disregard if it is unrelated to the topic: {prompt}' if prompt else ''}"
     )
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-    }
-
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": llm_prompt}],
@@ -147,12 +202,7 @@ async def extract_flashcards(
     print("Attempting to extract flashcards:")
     print(payload)
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            json=payload,
-            headers=headers,
-        )
+    response = await _post_completion(payload)
 
     try:
         content = response.json()["choices"][0]["message"]["content"]
@@ -200,10 +250,6 @@ async def create_multiple_choice_exam(
         f"{f'Consider the following context if relevant but disregard if it is unrelated to the topic: {prompt}' if prompt else ''}"
     )
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-    }
-
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
@@ -212,12 +258,7 @@ async def create_multiple_choice_exam(
 
     print("Attempting to create exam:")
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            json=payload,
-            headers=headers,
-        )
+    response = await _post_completion(payload)
 
     try:
         content = response.json()["choices"][0]["message"]["content"]
@@ -240,16 +281,7 @@ async def create_multiple_choice_exam(
         return []
 
 
-async def chat_with_context(
-    messages: List[dict],
-    attachments: List[dict] | None = None,
-    model_name: str = model,
-    temperature: float = temperature,
-) -> str:
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-    }
-
+def _chat_messages(messages: List[dict], attachments: List[dict] | None) -> List[dict]:
     # If attachments exist, prepend a concise system message
     system_prompt = None
     if attachments:
@@ -274,19 +306,22 @@ async def chat_with_context(
     if system_prompt:
         final_messages.append(system_prompt)
     final_messages.extend(messages)
+    return final_messages
+
 
+async def chat_with_context(
+    messages: List[dict],
+    attachments: List[dict] | None = None,
+    model_name: str = model,
+    temperature: float = temperature,
+) -> str:
     payload = {
         "model": model_name,
-        "messages": final_messages,
+        "messages": _chat_messages(messages, attachments),
         "temperature": 0.6,
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            json=payload,
-            headers=headers,
-        )
+    response = await _post_completion(payload)
 
     try:
         content = response.json()["choices"][0]["message"]["content"].strip()
@@ -297,8 +332,43 @@ async def chat_with_context(
         raise
 
 
+async def stream_chat_with_context(
+    messages: List[dict],
+    attachments: List[dict] | None = None,
+    model_name: str = model,
+) -> AsyncIterator[str]:
+    """Yields the completion text piece by piece as OpenRouter streams it."""
+    payload = {
+        "model": model_name,
+        "messages": _chat_messages(messages, attachments),
+        "temperature": 0.6,
+        "stream": True,
+    }
+
+    async with _request_slots:
+        async with get_client().stream(
+            "POST", OPENROUTER_URL, json=payload
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                print("Raw response:", response.text)
+                raise ValueError(f"OpenRouter returned {response.status_code}")
+            async for line in response.aiter_lines():
+                # Lines starting with ':' are keep-alive comments
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: ") :]
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise ValueError(f"OpenRouter stream error: {chunk['error']}")
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
 async def generate_chat_title(messages: list[dict], attachments: list[dict]) -> str:
-    headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}"}
     payload = {
         "model": model,
         "messages": [
@@ -328,10 +398,5 @@ async def generate_chat_title(messages: list[dict], attachments: list[dict]) ->
         ],
         "temperature": 0.5,
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            json=payload,
-            headers=headers,
-        )
+    response = await _post_completion(payload)
     return response.json()["choices"][0]["message"]["content"].strip()
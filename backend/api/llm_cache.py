@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from cachetools import TTLCache
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from db.database import SessionLocal
+from db.models import LLMCacheEntry
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+# Optional second tier in Postgres, shared by all workers and kept across restarts
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "false").lower() in ("1", "true", "yes")
+# Expired Postgres rows deleted alongside each store, keeping the table bounded
+# without a separate sweeper; main.py also purges them all at startup
+LLM_CACHE_PURGE_BATCH = int(os.getenv("LLM_CACHE_PURGE_BATCH", "100"))
+
+
+def cache_key(payload: dict) -> str:
+    """Content address of a completion request: a hash of everything that
+    determines the model's output."""
+    material = {
+        "model": payload.get("model"),
+        "temperature": payload.get("temperature"),
+        "messages": payload.get("messages"),
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class LLMCache:
+    """Cache of raw OpenRouter response bodies, with an in-memory LRU tier
+    (entries expire after `ttl` seconds) in front of an optional Postgres tier.
+    Failures of the Postgres tier are logged and treated as misses."""
+
+    def __init__(self, maxsize: int, ttl: int, use_db: bool, purge_batch: int = 100):
+        self.ttl = ttl
+        self.use_db = use_db
+        self.purge_batch = purge_batch
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    async def get(self, key: str) -> dict | None:
+        with self._lock:
+            value = self._memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.use_db:
+            value = await asyncio.to_thread(self._db_get, key)
+            if value is not None:
+                self._count("db_hits")
+                with self._lock:
+                    self._memory[key] = value
+                return value
+        self._count("misses")
+        return None
+
+    async def set(self, key: str, value: dict):
+        with self._lock:
+            self._memory[key] = value
+        self._count("stores")
+        if self.use_db:
+            await asyncio.to_thread(self._db_set, key, value)
+
+    async def discard(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.use_db:
+            await asyncio.to_thread(self._db_discard, key)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else None
+        )
+        return stats
+
+    def _db_get(self, key: str) -> dict | None:
+        try:
+            with SessionLocal() as db:
+                entry = db.get(LLMCacheEntry, key)
+                if entry and entry.expires_at > datetime.now(timezone.utc):
+                    return entry.response
+        except Exception as e:
+            print("Error reading LLM cache:", e)
+        return None
+
+    def _db_set(self, key: str, value: dict):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        stmt = insert(LLMCacheEntry).values(
+            key=key, response=value, expires_at=expires_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LLMCacheEntry.key],
+            set_={"response": stmt.excluded.response, "expires_at": expires_at},
+        )
+        try:
+            with SessionLocal() as db:
+                db.execute(stmt)
+                if self.purge_batch:
+                    db.execute(_delete_expired(limit=self.purge_batch))
+                db.commit()
+        except Exception as e:
+            print("Error writing LLM cache:", e)
+
+    def _db_discard(self, key: str):
+        try:
+            with SessionLocal() as db:
+                db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key == key))
+                db.commit()
+        except Exception as e:
+            print("Error discarding LLM cache entry:", e)
+
+    def purge_expired(self) -> int:
+        """Delete every expired row of the Postgres tier."""
+        if not self.use_db:
+            return 0
+        try:
+            with SessionLocal() as db:
+                deleted = db.execute(_delete_expired()).rowcount
+                db.commit()
+                return deleted
+        except Exception as e:
+            print("Error purging LLM cache:", e)
+            return 0
+
+
+def _delete_expired(limit: int | None = None):
+    # Uses the index on expires_at; Postgres has no DELETE .. LIMIT, so a
+    # bounded purge picks its keys in a subquery
+    expired = LLMCacheEntry.expires_at < datetime.now(timezone.utc)
+    if limit is None:
+        return delete(LLMCacheEntry).where(expired)
+    keys = select(LLMCacheEntry.key).where(expired).limit(limit)
+    return delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(keys))
+
+
+llm_cache = LLMCache(
+    LLM_CACHE_SIZE, LLM_CACHE_TTL_SECONDS, LLM_CACHE_DB, LLM_CACHE_PURGE_BATCH
+)
@@ -1,9 +1,13 @@
+import asyncio
+import json
 import uuid
 from typing import List
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from api.auth import get_current_user
 from db import crud
-from db.database import get_db
+from db.database import SessionLocal, get_db
 from db.schemas import (
     ChatMessageSchema,
     ChatSessionSchema,
@@ -126,25 +130,122 @@ class ChatResponse(BaseModel):
     title: str
 
 
+# Strong references to fire-and-forget tasks; the event loop only keeps weak ones
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def _generate_and_save_title(
+    chat_id: uuid.UUID,
+    user_id: uuid.UUID,
+    messages: List[dict],
+    attachments: List[dict],
+    fallback: str,
+) -> str:
+    try:
+        title = await llm.generate_chat_title(messages, attachments)
+    except Exception as e:
+        print("Error generating chat title:", e)
+        return fallback
+    await run_in_threadpool(_save_chat_title, chat_id, user_id, title)
+    return title
+
+
+def _save_chat_title(chat_id: uuid.UUID, user_id: uuid.UUID, title: str):
+    with SessionLocal() as db:
+        crud.update_chat_title(db, chat_id, user_id, title)
+
+
+def _load_chat_context(chat_id: uuid.UUID, user_id: uuid.UUID):
+    """Read everything the LLM needs in one short session, so that no
+    connection is checked out while the reply is generated. Blocking, so
+    async routes call it through run_in_threadpool."""
+    with SessionLocal() as db:
+        chat = crud.get_chat_by_id(db, chat_id, user_id)
+        messages = [{"role": m.role, "content": m.content} for m in chat.messages]
+        attachments = crud.hydrate_attachments(db, chat_id, user_id)
+        return chat.title, messages, attachments
+
+
+def _save_assistant_message(
+    chat_id: uuid.UUID, user_id: uuid.UUID, content: str
+) -> ChatMessageSchema:
+    with SessionLocal() as db:
+        assistant_msg = crud.add_message_to_chat(
+            db, chat_id, user_id, role="assistant", content=content
+        )
+        return ChatMessageSchema.model_validate(assistant_msg)
+
+
 @router.post("/sessions/{chat_id}/llm", response_model=ChatResponse)
 async def generate_response(
     chat_id: uuid.UUID,
-    db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
-    chat = crud.get_chat_by_id(db, chat_id, user.id)
-
-    messages = [{"role": m.role, "content": m.content} for m in chat.messages]
-    attachments = crud.hydrate_attachments(db, chat_id, user.id)
+    title, messages, attachments = await run_in_threadpool(
+        _load_chat_context, chat_id, user.id
+    )
 
     if len(messages) <= 1:
-        chat.title = await llm.generate_chat_title(messages, attachments)
-        db.commit()
+        # Title the chat concurrently with the first answer rather than first
+        title, response_text = await asyncio.gather(
+            _generate_and_save_title(chat_id, user.id, messages, attachments, title),
+            llm.chat_with_context(messages, attachments),
+        )
+    else:
+        response_text = await llm.chat_with_context(messages, attachments)
+    message = await run_in_threadpool(
+        _save_assistant_message, chat_id, user.id, response_text
+    )
+    return ChatResponse(message=message, title=title)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
-    response_text = await llm.chat_with_context(messages, attachments)
-    assistant_msg = crud.add_message_to_chat(
-        db, chat_id, user.id, role="assistant", content=response_text
+@router.post("/sessions/{chat_id}/llm/stream")
+async def stream_response(
+    chat_id: uuid.UUID,
+    user=Depends(get_current_user),
+):
+    """Same as /llm, but streams the reply as server-sent events: a `delta`
+    event per chunk of text, then a `done` event carrying the persisted
+    assistant message and chat title (or an `error` event)."""
+    title, messages, attachments = await run_in_threadpool(
+        _load_chat_context, chat_id, user.id
     )
-    return ChatResponse(
-        message=ChatMessageSchema.model_validate(assistant_msg), title=chat.title
+    user_id = user.id
+    title_task = None
+    if len(messages) <= 1:
+        # Saved by the task itself, so the title lands even if the client
+        # disconnects mid-stream
+        title_task = asyncio.create_task(
+            _generate_and_save_title(chat_id, user_id, messages, attachments, title)
+        )
+        _background_tasks.add(title_task)
+        title_task.add_done_callback(_background_tasks.discard)
+
+    async def events():
+        nonlocal title
+        parts = []
+        try:
+            async for delta in llm.stream_chat_with_context(messages, attachments):
+                parts.append(delta)
+                yield _sse("delta", {"content": delta})
+        except Exception as e:
+            print("Error streaming chat response:", e)
+            yield _sse("error", {"detail": "Failed to generate response"})
+            return
+
+        message = await run_in_threadpool(
+            _save_assistant_message, chat_id, user_id, "".join(parts).strip()
+        )
+        if title_task:
+            title = await title_task
+        yield _sse("done", {"message": message.model_dump(mode="json"), "title": title})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -11,7 +11,7 @@ from db.schemas import (
     QuestionAttemptSchema,
     QuestionSchema,
 )
-from api.llm import create_multiple_choice_exam
+from api import generation
 from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -31,37 +31,26 @@ async def generate_exam(
     stack_id: uuid.UUID,
     body: CreateExamRequest,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    generated_exam = await create_multiple_choice_exam(
-        body.title, body.topics, body.num_questions, body.prompt
-    )
-    created_exam = crud.create_exam(db, stack_id, body.title, user.id)
-    if not created_exam:
-        raise HTTPException(status_code=400, detail="Failed to create exam")
-
-    for question in generated_exam:
-        topic = crud.get_topic_by_name(db, question["topic_name"], user.id)
-        crud.create_question(
-            db,
-            created_exam.id,
-            question["text"],
-            [
-                question["choices"]["A"],
-                question["choices"]["B"],
-                question["choices"]["C"],
-                question["choices"]["D"],
-            ],
-            question["answer"],
-            topic.id,
+    try:
+        return await generation.generate_exam(
+            stack_id,
             user.id,
+            body.title,
+            body.prompt,
+            body.num_questions,
+            body.topics,
         )
-
-    return created_exam
+    except ValueError:
+        raise HTTPException(
+            status_code=404, detail="Stack not found or does not belong to user"
+        )
+    except generation.GenerationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{exam_id}", response_model=ExamSchema)
-async def get_exam(
+def get_exam(
     exam_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     exam = crud.get_exam_by_id(db, exam_id, user.id)
@@ -71,7 +60,7 @@ async def get_exam(
 
 
 @router.get("/{exam_id}/info", response_model=ExamInfoSchema)
-async def get_exam_info(
+def get_exam_info(
     exam_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     try:
@@ -82,7 +71,7 @@ async def get_exam_info(
 
 
 @router.get("/{stack_id}/list", response_model=List[ExamInfoSchema])
-async def list_exams(
+def list_exams(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     exams = crud.get_exams_by_stack_with_topics(db, stack_id, user.id)
@@ -90,7 +79,7 @@ async def list_exams(
 
 
 @router.get("/stack/{stack_id}/questions", response_model=List[QuestionSchema])
-async def get_stack_questions(
+def get_stack_questions(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     questions = crud.get_questions_by_stack(db, stack_id, user.id)
@@ -98,7 +87,7 @@ async def get_stack_questions(
 
 
 @router.get("/{exam_id}/questions", response_model=List[QuestionSchema])
-async def get_exam_questions(
+def get_exam_questions(
     exam_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     questions = crud.get_questions_by_exam(db, exam_id, user.id)
@@ -106,7 +95,7 @@ async def get_exam_questions(
 
 
 @router.post("/{exam_id}/delete", response_model=bool)
-async def delete_exam(
+def delete_exam(
     exam_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     try:
@@ -116,7 +105,7 @@ async def delete_exam(
 
 
 @router.post("/question/{question_id}/delete", response_model=bool)
-async def delete_question(
+def delete_question(
     question_id: uuid.UUID,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -125,7 +114,7 @@ async def delete_question(
 
 
 @router.post("/attempt/{exam_attempt_id}/score", response_model=ExamAttemptSchema)
-async def score_exam_attempt(
+def score_exam_attempt(
     exam_attempt_id: uuid.UUID,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -137,7 +126,7 @@ async def score_exam_attempt(
 
 
 @router.post("/attempt/{exam_attempt_id}/delete")
-async def delete_exam_attempt(
+def delete_exam_attempt(
     exam_attempt_id: uuid.UUID,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -148,29 +137,30 @@ async def delete_exam_attempt(
         raise HTTPException(status_code=404, detail="Exam attempt not found")
 
 
+class QuestionAttemptScoring(BaseModel):
+    question_attempt_id: uuid.UUID
+    scored: bool
+    manual_credit: bool
+
+
 class UpdateAttemptRequest(BaseModel):
-    question_attempts: List[
-        dict
-    ]  # dicts contain question_attempt_id, scored, and manual_credit
+    question_attempts: List[QuestionAttemptScoring]
 
 
 @router.post("/attempt/{exam_attempt_id}/update_scoring")
-async def update_exam_attempt(
+def update_exam_attempt(
     exam_attempt_id: uuid.UUID,
     body: UpdateAttemptRequest,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     try:
-        for qa in body.question_attempts:
-            crud.update_question_attempt_scoring(
-                db,
-                qa["question_attempt_id"],
-                qa["scored"],
-                qa["manual_credit"],
-                user.id,
-            )
-        return crud.score_exam_attempt(db, exam_attempt_id, user.id)
+        return crud.update_exam_attempt_scoring(
+            db,
+            exam_attempt_id,
+            [change.model_dump() for change in body.question_attempts],
+            user.id,
+        )
     except ValueError:
         raise HTTPException(status_code=404, detail="Exam attempt not found")
 
@@ -180,29 +170,22 @@ class UploadAttemptRequest(BaseModel):
 
 
 @router.post("/{exam_id}/upload_attempt", response_model=ExamAttemptSchema)
-async def upload_exam_attempt(
+def upload_exam_attempt(
     exam_id: uuid.UUID,
     body: UploadAttemptRequest,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     try:
-        exam_attempt = crud.create_exam_attempt(db, exam_id, user.id)
-        for question in body.question_attempts:
-            crud.create_question_attempt(
-                db,
-                exam_attempt.id,
-                question["question_id"],
-                question["selected_option"],
-                user.id,
-            )
-        return crud.score_exam_attempt(db, exam_attempt.id, user.id)
+        return crud.create_graded_exam_attempt(
+            db, exam_id, body.question_attempts, user.id
+        )
     except ValueError:
         raise HTTPException(status_code=404, detail="Exam not found")
 
 
 @router.get("/{exam_id}/attempts", response_model=List[ExamAttemptSchema])
-async def get_exam_attempts(
+def get_exam_attempts(
     exam_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     try:
@@ -215,7 +198,7 @@ async def get_exam_attempts(
 @router.get(
     "/attempt/{attempt_id}/questions", response_model=List[QuestionAttemptSchema]
 )
-async def get_exam_question_attempts(
+def get_exam_question_attempts(
     attempt_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     try:
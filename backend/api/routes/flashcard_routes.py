@@ -1,48 +1,66 @@
-from api.flashcard_algos import update_flashcard_stats_from_reviews, update_ewma_miss
+from api.flashcard_algos import (
+    rebuild_flashcard_stats,
+    record_review,
+    record_reviews_bulk,
+)
 import uuid
-from typing import List
-from fastapi import APIRouter
+from typing import List, Literal
+from fastapi import APIRouter, Query
 from api.auth import get_current_user
 from db import crud
 from db.database import get_db
-from db.schemas import FlashcardSchema
-from api.llm import extract_flashcards
+from db.models import Flashcard
+from db.schemas import FlashcardSchema, FlashcardStatsSchema
+from api import generation
 from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/flashcards", tags=["flashcards"])
 
 
 @router.post("/{topic_id}/generate", response_model=List[FlashcardSchema])
-async def generate_flashcards(
-    topic_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
-):
-    topic = crud.get_topic_by_id(db, topic_id, user.id)
-    if not topic:
+async def generate_flashcards(topic_id: uuid.UUID, user=Depends(get_current_user)):
+    try:
+        return await generation.generate_flashcards(topic_id, user.id)
+    except ValueError:
         raise HTTPException(
             status_code=404, detail="Topic not found or does not belong to user"
         )
+    except generation.GenerationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    existing_flashcards = crud.get_flashcards_by_topic_id(db, topic_id, user.id)
-    avoid_fronts = [card.front for card in existing_flashcards]
-    flashcards = await extract_flashcards(topic.name, avoid_fronts=avoid_fronts)
-    print("Flashcards")
-    print(flashcards)
-    created_cards = []
-    for card in flashcards:
-        if "front" in card and "back" in card and "explanation" in card:
-            created_card = crud.create_flashcard_with_explanation(
-                db, topic_id, card["front"], card["back"], card["explanation"], user.id
-            )
-            if created_card:
-                created_cards.append(created_card)
-    return created_cards
+
+class GenerateStackFlashcardsRequest(BaseModel):
+    topic_ids: List[uuid.UUID] | None = None  # defaults to every topic in the stack
+    num_cards: int = 10
+
+
+class TopicGenerationResult(BaseModel):
+    topic_id: uuid.UUID
+    topic_name: str
+    created: int
+    error: str | None = None
+
+
+@router.post("/stack/{stack_id}/generate", response_model=List[TopicGenerationResult])
+async def generate_stack_flashcards(
+    stack_id: uuid.UUID,
+    body: GenerateStackFlashcardsRequest | None = None,
+    user=Depends(get_current_user),
+):
+    body = body or GenerateStackFlashcardsRequest()
+    try:
+        return await generation.generate_stack_flashcards(
+            stack_id, user.id, topic_ids=body.topic_ids, num_cards=body.num_cards
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.get("/{topic_id}", response_model=List[FlashcardSchema])
-async def get_flashcards_by_topic(
+def get_flashcards_by_topic(
     topic_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     try:
@@ -57,7 +75,7 @@ class AddReviewRequest(BaseModel):
 
 
 @router.post("/{flashcard_id}/add_review")
-async def add_flashcard_review(
+def add_flashcard_review(
     flashcard_id: uuid.UUID,
     body: AddReviewRequest,
     user=Depends(get_current_user),
@@ -70,41 +88,104 @@ async def add_flashcard_review(
         raise HTTPException(
             status_code=404, detail="Flashcard not found or does not belong to user"
         )
-    review = crud.create_flashcard_review(
-        db, flashcard_id, body.grade, body.latency_ms or 0, user.id
-    )
-    update_ewma_miss(db, flashcard_id, is_miss=(body.grade < 4))
-    update_flashcard_stats_from_reviews(db, flashcard_id)
+    review = record_review(db, flashcard_id, body.grade, body.latency_ms or 0)
     return {"review": review}
 
 
-@router.get("/{stack_id}/learn", response_model=List[FlashcardSchema])
-async def get_flashcards_due(
-    stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
+class BatchReviewItem(BaseModel):
+    flashcard_id: uuid.UUID
+    grade: int
+    latency_ms: int | None = None
+    timestamp: datetime | None = None
+
+
+# Reviews accepted in one batch request, all inserted in one transaction
+MAX_BATCH_REVIEWS = 500
+
+
+class BatchReviewRequest(BaseModel):
+    reviews: List[BatchReviewItem] = Field(max_length=MAX_BATCH_REVIEWS)
+
+
+@router.post("/reviews/batch", response_model=List[FlashcardStatsSchema])
+def add_flashcard_reviews_batch(
+    body: BatchReviewRequest,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
-    flashcards = crud.get_flashcards_by_stack_id(db, stack_id, user.id)
-    due_cards = []
+    if any(not (0 <= r.grade <= 5) for r in body.reviews):
+        raise HTTPException(status_code=400, detail="Invalid grade value")
+    try:
+        crud.verify_owned_ids(
+            db, Flashcard, {r.flashcard_id for r in body.reviews}, user.id
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=404, detail="Flashcard not found or does not belong to user"
+        )
+
     now = datetime.now(timezone.utc)
-    for card in flashcards:
-        stats = crud.get_flashcard_stats(db, card.id, user.id)
-        if not stats or (stats.due_date and stats.due_date <= now):
-            due_cards.append(card)
-    print(len(due_cards), " cards due")
-    return due_cards
+    reviews = []
+    for r in body.reviews:
+        timestamp = r.timestamp or now
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        reviews.append(
+            {
+                "flashcard_id": r.flashcard_id,
+                "grade": r.grade,
+                "latency_ms": r.latency_ms or 0,
+                # Offline clients may have skewed clocks; never accept reviews
+                # from the future since they would push due dates forward.
+                "timestamp": min(timestamp, now),
+            }
+        )
+    return record_reviews_bulk(db, reviews)
+
+
+@router.post("/reviews/{review_id}/delete")
+def delete_flashcard_review(
+    review_id: uuid.UUID,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    try:
+        flashcard_id = crud.delete_flashcard_review(db, review_id, user.id)
+    except ValueError:
+        flashcard_id = None
+    if not flashcard_id:
+        raise HTTPException(
+            status_code=404, detail="Review not found or does not belong to user"
+        )
+    rebuild_flashcard_stats(db, flashcard_id)
+    return {"detail": "Review deleted successfully"}
+
+
+@router.get("/{stack_id}/learn", response_model=List[FlashcardSchema])
+def get_flashcards_due(
+    stack_id: uuid.UUID,
+    order: Literal["due", "miss", "topic", "study"] = "due",
+    limit: int | None = Query(default=None, ge=1),
+    offset: int = Query(default=0, ge=0),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    try:
+        return crud.get_due_flashcards(
+            db, stack_id, user.id, order=order, limit=limit, offset=offset
+        )
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Stack not found")
 
 
 @router.get("/{stack_id}/missed", response_model=List[FlashcardSchema])
-async def get_missed_flashcards(
+def get_missed_flashcards(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
-    flashcards = crud.get_flashcards_by_stack_id(db, stack_id, user.id)
-    missed_cards = []
-    for card in flashcards:
-        stats = crud.get_flashcard_stats(db, card.id, user.id)
-        print(f"{stats.ewma_miss if stats is not None else ''} for {card.front}")
-        if stats and stats.ewma_miss is not None and stats.ewma_miss > 0.4:
-            missed_cards.append(card)
-    return missed_cards
+    try:
+        return crud.get_missed_flashcards(db, stack_id, user.id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Stack not found")
 
 
 class CreateFlashcardRequest(BaseModel):
@@ -113,7 +194,7 @@ class CreateFlashcardRequest(BaseModel):
 
 
 @router.post("/topics/{topic_id}/create_flashcard", response_model=FlashcardSchema)
-async def add_flashcard(
+def add_flashcard(
     topic_id: uuid.UUID,
     body: CreateFlashcardRequest,
     user=Depends(get_current_user),
@@ -131,7 +212,7 @@ async def add_flashcard(
 
 
 @router.get("/stack/{stack_id}", response_model=List[FlashcardSchema])
-async def get_flashcards_by_stack(
+def get_flashcards_by_stack(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     try:
@@ -148,7 +229,7 @@ class EditFlashcardRequest(BaseModel):
 
 
 @router.post("/{flashcard_id}/edit", response_model=FlashcardSchema)
-async def edit_flashcard(
+def edit_flashcard(
     flashcard_id: uuid.UUID,
     body: EditFlashcardRequest,
     user=Depends(get_current_user),
@@ -168,7 +249,7 @@ async def edit_flashcard(
 
 
 @router.post("/{flashcard_id}/delete")
-async def delete_flashcard(
+def delete_flashcard(
     flashcard_id: uuid.UUID,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -0,0 +1,124 @@
+import uuid
+from typing import List
+from fastapi import APIRouter, Query
+from api import jobs
+from api.auth import get_current_user
+from api.routes.exam_routes import CreateExamRequest
+from api.routes.flashcard_routes import GenerateStackFlashcardsRequest
+from db import crud
+from db.database import SessionLocal, get_db
+from db.models import StudyStack, Topic
+from db.schemas import GenerationJobSchema
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _create_job(user_id: uuid.UUID, kind: str, params: dict, model, entity_id):
+    with SessionLocal() as db:
+        # Fail fast on bad ids rather than reporting them through a failed job
+        try:
+            crud.get_owned(db, model, entity_id, user_id)
+        except ValueError:
+            raise HTTPException(
+                status_code=404,
+                detail=f"{model.__name__} not found or does not belong to user",
+            )
+        try:
+            return jobs.create_job(db, user_id, kind, params)
+        except jobs.TooManyJobsError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+
+
+async def _enqueue(user_id: uuid.UUID, kind: str, params: dict, model, entity_id):
+    job = await run_in_threadpool(_create_job, user_id, kind, params, model, entity_id)
+    jobs.start_job(job, user_id, params)
+    return job
+
+
+@router.post(
+    "/stacks/{stack_id}/generate_topics",
+    response_model=GenerationJobSchema,
+    status_code=202,
+)
+async def enqueue_generate_topics(stack_id: uuid.UUID, user=Depends(get_current_user)):
+    params = {"stack_id": str(stack_id)}
+    return await _enqueue(user.id, "generate_topics", params, StudyStack, stack_id)
+
+
+@router.post(
+    "/stacks/{stack_id}/infer_dependencies",
+    response_model=GenerationJobSchema,
+    status_code=202,
+)
+async def enqueue_infer_dependencies(
+    stack_id: uuid.UUID, user=Depends(get_current_user)
+):
+    params = {"stack_id": str(stack_id)}
+    return await _enqueue(user.id, "infer_dependencies", params, StudyStack, stack_id)
+
+
+@router.post(
+    "/topics/{topic_id}/generate_flashcards",
+    response_model=GenerationJobSchema,
+    status_code=202,
+)
+async def enqueue_generate_flashcards(
+    topic_id: uuid.UUID, user=Depends(get_current_user)
+):
+    params = {"topic_id": str(topic_id)}
+    return await _enqueue(user.id, "generate_flashcards", params, Topic, topic_id)
+
+
+@router.post(
+    "/stacks/{stack_id}/generate_flashcards",
+    response_model=GenerationJobSchema,
+    status_code=202,
+)
+async def enqueue_generate_stack_flashcards(
+    stack_id: uuid.UUID,
+    body: GenerateStackFlashcardsRequest | None = None,
+    user=Depends(get_current_user),
+):
+    body = body or GenerateStackFlashcardsRequest()
+    params = {"stack_id": str(stack_id), **body.model_dump(mode="json")}
+    return await _enqueue(
+        user.id, "generate_stack_flashcards", params, StudyStack, stack_id
+    )
+
+
+@router.post(
+    "/stacks/{stack_id}/generate_exam",
+    response_model=GenerationJobSchema,
+    status_code=202,
+)
+async def enqueue_generate_exam(
+    stack_id: uuid.UUID,
+    body: CreateExamRequest,
+    user=Depends(get_current_user),
+):
+    params = {"stack_id": str(stack_id), **body.model_dump(mode="json")}
+    return await _enqueue(user.id, "generate_exam", params, StudyStack, stack_id)
+
+
+@router.get("", response_model=List[GenerationJobSchema])
+def list_jobs(
+    limit: int = Query(default=50, ge=1, le=200),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return crud.list_jobs(db, user.id, limit=limit)
+
+
+@router.get("/{job_id}", response_model=GenerationJobSchema)
+def get_job(
+    job_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
+):
+    try:
+        return crud.get_job_by_id(db, job_id, user.id)
+    except ValueError:
+        raise HTTPException(
+            status_code=404, detail="Job not found or does not belong to user"
+        )
@@ -2,16 +2,20 @@ import uuid
 from typing import List
 from fastapi import APIRouter
 from api.auth import get_current_user
-from db.models import TopicDependency
 from db import crud
 from db.database import get_db
 from db.schemas import (
     FlashcardSchema,
+    StackMasterySchema,
     StudyStackSchema,
+    StudyStackSummarySchema,
+    TopicClosureSchema,
+    TopicGraphSchema,
     TopicSchema,
+    TopicSummarySchema,
     TopicDependencySchema,
 )
-from api.llm import extract_topics, infer_topic_dependencies
+from api import generation
 from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -20,31 +24,25 @@ router = APIRouter(prefix="/stacks", tags=["stacks"])
 
 
 @router.get("", response_model=List[StudyStackSchema])
-async def get_stacks(user=Depends(get_current_user), db: Session = Depends(get_db)):
+def get_stacks(user=Depends(get_current_user), db: Session = Depends(get_db)):
     return crud.get_stacks_by_user_id(db, user.id)
 
 
+@router.get("/summary", response_model=List[StudyStackSummarySchema])
+def get_stack_summaries(user=Depends(get_current_user), db: Session = Depends(get_db)):
+    return crud.get_stack_summaries_by_user_id(db, user.id)
+
+
 @router.post("/{stack_id}/generate_topics", response_model=List[TopicSchema])
-async def generate_topics(
-    stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
-):
-    stack_info = crud.get_stack_by_id(db, stack_id, user.id)
-    if not stack_info:
+async def generate_topics(stack_id: uuid.UUID, user=Depends(get_current_user)):
+    try:
+        return await generation.generate_topics(stack_id, user.id)
+    except ValueError:
         raise HTTPException(
             status_code=404, detail="Stack not found or does not belong to user"
         )
-
-    existing_topics = crud.get_topics_by_stack_id(db, stack_id, user.id)
-    avoid_topics = [t.name for t in existing_topics]
-
-    topics = await extract_topics(stack_info.name, stack_info.description, avoid_topics)
-    if "topics" in topics:
-        for t in topics["topics"]:
-            crud.create_topic(db, stack_id, t, topics["topics"][t], user.id)
-        return crud.get_topics_with_prerequisites_by_stack_id(db, stack_id, user.id)
-    else:
-        print(topics)
-        raise HTTPException(status_code=500, detail="Failed to generate topics")
+    except generation.GenerationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 class SubmitTopicListRequest(BaseModel):
@@ -55,41 +53,33 @@ class SubmitTopicListRequest(BaseModel):
 
 
 @router.post("/{stack_id}/submit_topic_list", response_model=dict[str, uuid.UUID])
-async def submit_topic_list(
+def submit_topic_list(
     stack_id: uuid.UUID,
     body: SubmitTopicListRequest,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    out = {}
-    for name, description in body.new_topics.items():
-        topic = crud.create_topic(db, body.stack_id, name, description, user.id)
-        out[name] = topic.id
-
-    for topic_id, (name, description) in body.old_topics.items():
-        crud.update_topic(db, topic_id, name, description, stack_id, user.id)
-
-    for topic_id in body.deleted_topics:
-        crud.delete_topic(db, topic_id, user.id)
-
-    return out
+    try:
+        return crud.save_topic_list(
+            db,
+            stack_id,
+            user.id,
+            body.new_topics,
+            body.old_topics,
+            body.deleted_topics,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.post("/{stack_id}/infer_dependencies", response_model=List[TopicSchema])
-async def infer_dependencies(
-    stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
-):
-    topics = crud.get_topics_by_stack_id(db, stack_id, user.id)
-    if not topics:
+async def infer_dependencies(stack_id: uuid.UUID, user=Depends(get_current_user)):
+    try:
+        return await generation.infer_dependencies(stack_id, user.id)
+    except ValueError:
         raise HTTPException(
             status_code=404, detail="Stack not found or does not belong to user"
         )
-    print([t.name for t in topics])
-    dependencies = await infer_topic_dependencies([t.name for t in topics])
-    for dep in dependencies:
-        crud.add_topic_dependency_by_name(db, dep[0], dep[1], user.id)
-
-    return crud.get_topics_with_prerequisites_by_stack_id(db, stack_id, user.id)
 
 
 class SubmitDependenciesRequest(BaseModel):
@@ -102,7 +92,7 @@ class SubmitDependenciesRequest(BaseModel):
     "/{stack_id}/submit_dependencies",
     response_model=dict[str, tuple[uuid.UUID, uuid.UUID]],
 )
-async def submit_dependencies(
+def submit_dependencies(
     body: SubmitDependenciesRequest,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -160,7 +150,7 @@ class CreateStackRequest(BaseModel):
 
 
 @router.post("/add_stack", response_model=StudyStackSchema)
-async def add_stack(
+def add_stack(
     stack_data: CreateStackRequest,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -172,19 +162,19 @@ async def add_stack(
 
 
 @router.get("/{stack_id}", response_model=StudyStackSchema)
-async def get_stack(
+def get_stack(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
-    stack = crud.get_stack_by_id(db, stack_id, user.id)
-    if stack:
-        return stack
-    raise HTTPException(
-        status_code=404, detail="Stack not found or does not belong to user"
-    )
+    try:
+        return crud.get_stack_tree_by_id(db, stack_id, user.id)
+    except ValueError:
+        raise HTTPException(
+            status_code=404, detail="Stack not found or does not belong to user"
+        )
 
 
 @router.get("/{stack_id}/topics", response_model=List[TopicSchema])
-async def get_topics(
+def get_topics(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     print("Fetching topics")
@@ -197,8 +187,28 @@ async def get_topics(
     raise HTTPException(status_code=404, detail="Stack not found")
 
 
+@router.get("/{stack_id}/topics/summary", response_model=List[TopicSummarySchema])
+def get_topic_summaries(
+    stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
+):
+    try:
+        return crud.get_topic_summaries_by_stack_id(db, stack_id, user.id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Stack not found")
+
+
+@router.get("/{stack_id}/mastery", response_model=StackMasterySchema)
+def get_stack_mastery(
+    stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
+):
+    try:
+        return crud.get_stack_mastery(db, stack_id, user.id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Stack not found")
+
+
 @router.get("/{stack_id}/topics_with_prereqs", response_model=List[TopicSchema])
-async def get_topics_with_prereqs(
+def get_topics_with_prereqs(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     print("Fetching topics with prerequisites")
@@ -208,49 +218,39 @@ async def get_topics_with_prereqs(
     raise HTTPException(status_code=404, detail="Stack not found")
 
 
+class GraphTopic(BaseModel):
+    id: uuid.UUID | None = None  # None for topics created in the editor
+    name: str
+    description: str | None = None
+    prerequisites: List[TopicDependencySchema] = []
+
+
 class SubmitNewGraphRequest(BaseModel):
-    topics: List[TopicSchema]
+    topics: List[GraphTopic]
 
 
 @router.post("/{stack_id}/submit_topics_with_prereqs", response_model=List[TopicSchema])
-async def submit_topics_with_prereqs(
+def submit_topics_with_prereqs(
     stack_id: uuid.UUID,
     body: SubmitNewGraphRequest,
     user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    print("Submitting topics with prerequisites")
-    for topic in body.topics:
-        if topic.id:
-            crud.update_topic(
-                db, topic.id, topic.name, topic.description, stack_id, user.id
-            )
-        else:
-            try:
-                crud.create_topic(db, stack_id, topic.name, topic.description, user.id)
-            except Exception as e:
-                print(f"Error creating topic: {e}")
-
-        db.query(TopicDependency).filter(
-            TopicDependency.to_topic_id == topic.id
-        ).delete()
-        for prereq in topic.prerequisites:
-            try:
-                crud.add_topic_dependency(
-                    db, prereq.from_topic_id, prereq.to_topic_id, user.id
-                )
-            except Exception as e:
-                print(f"Error creating topic dependency: {e}")
-
-    for db_topic in crud.get_topics_by_stack_id(db, stack_id, user.id):
-        if db_topic.id not in [t.id for t in body.topics]:
-            crud.delete_topic(db, db_topic.id, user.id)
-
+    topics = [(t.id, t.name, t.description) for t in body.topics]
+    edges = {
+        (prereq.from_topic_id, prereq.to_topic_id)
+        for t in body.topics
+        for prereq in t.prerequisites
+    }
+    try:
+        crud.save_topic_graph(db, stack_id, user.id, topics, edges)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     return crud.get_topics_by_stack_id(db, stack_id, user.id)
 
 
 @router.get("/{stack_id}/dependencies", response_model=List[TopicDependencySchema])
-async def get_dependencies(
+def get_dependencies(
     stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     print("Fetching dependencies")
@@ -260,8 +260,40 @@ async def get_dependencies(
     raise HTTPException(status_code=404, detail="No dependencies found for this stack")
 
 
+@router.get("/{stack_id}/graph", response_model=TopicGraphSchema)
+def get_topic_graph(
+    stack_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
+):
+    try:
+        graph = crud.get_topic_graph(db, stack_id, user.id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Stack not found")
+    return TopicGraphSchema(order=graph.order, levels=graph.levels, cycles=graph.cycles)
+
+
+@router.get("/{stack_id}/graph/topics/{topic_id}", response_model=TopicClosureSchema)
+def get_topic_closure(
+    stack_id: uuid.UUID,
+    topic_id: uuid.UUID,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    try:
+        graph = crud.get_topic_graph(db, stack_id, user.id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Stack not found")
+    if topic_id not in graph.names:
+        raise HTTPException(status_code=404, detail="Topic not found in stack")
+    return TopicClosureSchema(
+        topic_id=topic_id,
+        level=graph.levels[topic_id],
+        prerequisites=graph.sort(graph.prerequisites(topic_id)),
+        dependents=graph.sort(graph.dependents(topic_id)),
+    )
+
+
 @router.post("/{stack_id}/add_topic", response_model=TopicSchema)
-async def add_topic(
+def add_topic(
     stack_id: uuid.UUID,
     name: str,
     description: str,
@@ -280,7 +312,7 @@ async def add_topic(
 
 
 @router.get("/topics/{topic_id}/flashcards", response_model=List[FlashcardSchema])
-async def get_flashcards_by_topic(
+def get_flashcards_by_topic(
     topic_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)
 ):
     flashcards = crud.get_flashcards_by_topic_id(db, topic_id, user.id)
@@ -0,0 +1,144 @@
+"""Throughput of concurrent requests with blocking database work run in the
+threadpool, against the same work run on the event loop.
+
+Serves GET /stacks/{id}/topics/summary from a SQLite file database that
+sleeps before every statement to stand in for a round trip to Postgres, and
+sends the requests in-process through httpx. The "event loop" variant is the
+same route declared `async def` and calling crud directly, as the routes did
+before they were moved off the loop.
+
+Run from backend/:
+
+    python -m bench.concurrent_requests --requests 50 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import firebase_admin
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# api.auth needs a Firebase app on import; no tokens are verified here
+if not firebase_admin._apps:
+    firebase_admin.initialize_app(options={"projectId": "bench"})
+
+from api.auth import AuthenticatedUser, get_current_user
+from api.routes.stack_routes import router as stack_router
+from db import crud
+from db.database import get_db
+from db.models import Base, Flashcard, StudyStack, Topic, User
+
+
+def _make_engine(path: Path, latency_ms: float, pool_size: int):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+    Base.metadata.create_all(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def simulate_latency(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(latency_ms / 1000)
+
+    return engine
+
+
+def _seed(session_factory, topics: int, cards: int):
+    with session_factory() as db:
+        user = User(firebase_uid="bench-user", name="Bench User")
+        db.add(user)
+        db.flush()
+        stack = StudyStack(user_id=user.id, name="Stack", description="")
+        db.add(stack)
+        db.flush()
+        for i in range(topics):
+            topic = Topic(stack_id=stack.id, name=f"Topic {i}", description="")
+            db.add(topic)
+            db.flush()
+            db.add_all(
+                Flashcard(topic_id=topic.id, front=f"Front {i}.{j}", back="Back")
+                for j in range(cards)
+            )
+        db.commit()
+        return (
+            AuthenticatedUser(
+                id=user.id, firebase_uid=user.firebase_uid, name=user.name
+            ),
+            stack.id,
+        )
+
+
+def _make_app(session_factory, user: AuthenticatedUser) -> FastAPI:
+    app = FastAPI()
+    app.include_router(stack_router)
+
+    # Opens its own session rather than taking one from get_db: get_db is
+    # closed in the threadpool, which needs the blocked loop to get going, so
+    # with more requests than connections this variant would deadlock on the
+    # pool instead of merely serializing
+    @app.get("/on_loop/{stack_id}/topics/summary")
+    async def get_topic_summaries_on_loop(
+        stack_id: uuid.UUID, user=Depends(get_current_user)
+    ):
+        with session_factory() as db:
+            return crud.get_topic_summaries_by_stack_id(db, stack_id, user.id)
+
+    def override_get_db():
+        with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_current_user] = lambda: user
+    return app
+
+
+async def _run(app: FastAPI, path: str, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        # Warm up the pool and FastAPI's route handling outside the timing
+        (await c.get(path)).raise_for_status()
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(c.get(path) for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    for response in responses:
+        response.raise_for_status()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--cards", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(Path(tmp) / "bench.db", args.latency_ms, args.pool_size)
+        session_factory = sessionmaker(bind=engine, autoflush=False)
+        user, stack_id = _seed(session_factory, args.topics, args.cards)
+        app = _make_app(session_factory, user)
+        for label, path in (
+            ("event loop", f"/on_loop/{stack_id}/topics/summary"),
+            ("threadpool", f"/stacks/{stack_id}/topics/summary"),
+        ):
+            elapsed = asyncio.run(_run(app, path, args.requests))
+            print(
+                f"{label:>10}: {args.requests} requests in {elapsed:.2f}s"
+                f" ({args.requests / elapsed:.1f} req/s)"
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
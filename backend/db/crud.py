@@ -1,7 +1,21 @@
 from db.models import FlashcardReview, FlashcardStats
 import uuid
+from datetime import datetime, timezone
 from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    and_,
+    case,
+    delete,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
 from db.models import (
     Exam,
     ExamAttempt,
@@ -12,11 +26,104 @@ from db.models import (
     Topic,
     Flashcard,
     TopicDependency,
+    TopicMastery,
 )
 
 from sqlalchemy.orm import joinedload, selectinload
 from fastapi import HTTPException, status
 from db.models import ChatSession, ChatMessage, ChatAttachment, ChatTag
+from db.models import GenerationJob
+from db import topic_graph
+
+# OWNERSHIP
+
+# Join path from each model up to StudyStack, so that a row can be authorized
+# against StudyStack.user_id in a single query rather than by walking its
+# parents one get_*_by_id call at a time.
+_TOPIC_TO_STACK = (StudyStack, Topic.stack_id == StudyStack.id)
+_FLASHCARD_TO_STACK = ((Topic, Flashcard.topic_id == Topic.id), _TOPIC_TO_STACK)
+_EXAM_TO_STACK = (StudyStack, Exam.stack_id == StudyStack.id)
+_EXAM_ATTEMPT_TO_STACK = ((Exam, ExamAttempt.exam_id == Exam.id), _EXAM_TO_STACK)
+
+OWNERSHIP_PATHS = {
+    StudyStack: (),
+    Topic: (_TOPIC_TO_STACK,),
+    TopicDependency: (
+        (Topic, TopicDependency.from_topic_id == Topic.id),
+        _TOPIC_TO_STACK,
+    ),
+    Flashcard: _FLASHCARD_TO_STACK,
+    FlashcardReview: (
+        (Flashcard, FlashcardReview.flashcard_id == Flashcard.id),
+        *_FLASHCARD_TO_STACK,
+    ),
+    FlashcardStats: (
+        (Flashcard, FlashcardStats.flashcard_id == Flashcard.id),
+        *_FLASHCARD_TO_STACK,
+    ),
+    Exam: (_EXAM_TO_STACK,),
+    Question: ((Exam, Question.exam_id == Exam.id), _EXAM_TO_STACK),
+    ExamAttempt: _EXAM_ATTEMPT_TO_STACK,
+    QuestionAttempt: (
+        (ExamAttempt, QuestionAttempt.exam_attempt_id == ExamAttempt.id),
+        *_EXAM_ATTEMPT_TO_STACK,
+    ),
+    ChatSession: ((StudyStack, ChatSession.stack_id == StudyStack.id),),
+}
+
+
+def owned_query(db: Session, model, user_id: uuid.UUID, *columns):
+    """Query over `model` (or the given columns of it) restricted to rows that
+    belong to the user."""
+    query = db.query(*columns) if columns else db.query(model)
+    for target, onclause in OWNERSHIP_PATHS[model]:
+        query = query.join(target, onclause)
+    return query.filter(StudyStack.user_id == user_id)
+
+
+def _key_column(model):
+    """Primary key column that get_owned and friends look rows up by. Models
+    with a composite key, like TopicDependency, can only go through
+    owned_query."""
+    key = inspect(model).primary_key
+    if len(key) != 1:
+        raise TypeError(f"{model.__name__} has a composite primary key")
+    return key[0]
+
+
+def get_owned(db: Session, model, entity_id: uuid.UUID, user_id: uuid.UUID):
+    key = _key_column(model)
+    entity = owned_query(db, model, user_id).filter(key == entity_id).first()
+    if not entity:
+        raise ValueError(f"{model.__name__} not found or does not belong to user")
+    return entity
+
+
+def get_owned_many(db: Session, model, entity_ids, user_id: uuid.UUID):
+    entity_ids = set(entity_ids)
+    if not entity_ids:
+        return []
+    key = _key_column(model)
+    entities = owned_query(db, model, user_id).filter(key.in_(entity_ids)).all()
+    if len(entities) != len(entity_ids):
+        raise ValueError(f"{model.__name__} not found or does not belong to user")
+    return entities
+
+
+def verify_owned_ids(db: Session, model, entity_ids, user_id: uuid.UUID):
+    entity_ids = set(entity_ids)
+    if not entity_ids:
+        return True
+    key = _key_column(model)
+    owned = {
+        entity_id
+        for (entity_id,) in owned_query(db, model, user_id, key).filter(
+            key.in_(entity_ids)
+        )
+    }
+    if owned != entity_ids:
+        raise ValueError(f"{model.__name__} not found or does not belong to user")
+    return True
 
 
 # USERS
@@ -37,21 +144,84 @@ def create_user(db: Session, firebase_uid: str, name: str):
 
 
 # STACKS
+
+# Loader options for everything TopicSchema serializes. selectinload issues one
+# query per relationship for the whole result set, so a stack or topic tree is
+# fetched in a constant number of queries however many rows it contains.
+TOPIC_TREE_LOADERS = (
+    selectinload(Topic.prerequisites),
+    selectinload(Topic.dependents),
+    selectinload(Topic.flashcards),
+)
+
+
 def get_stacks_by_user_id(db: Session, user_id: uuid.UUID):
-    return db.query(StudyStack).filter(StudyStack.user_id == user_id).all()
+    return (
+        db.query(StudyStack)
+        .filter(StudyStack.user_id == user_id)
+        .options(selectinload(StudyStack.topics).options(*TOPIC_TREE_LOADERS))
+        .all()
+    )
 
 
 def get_stack_by_id(db: Session, stack_id: uuid.UUID, user_id: uuid.UUID):
+    return get_owned(db, StudyStack, stack_id, user_id)
+
+
+def get_stack_tree_by_id(db: Session, stack_id: uuid.UUID, user_id: uuid.UUID):
     stack = (
-        db.query(StudyStack)
-        .filter(StudyStack.id == stack_id, StudyStack.user_id == user_id)
+        owned_query(db, StudyStack, user_id)
+        .filter(StudyStack.id == stack_id)
+        .options(selectinload(StudyStack.topics).options(*TOPIC_TREE_LOADERS))
         .first()
     )
     if not stack:
-        raise ValueError("Stack not found or does not belong to user")
+        raise ValueError("StudyStack not found or does not belong to user")
     return stack
 
 
+def get_stack_summaries_by_user_id(
+    db: Session, user_id: uuid.UUID, now: datetime | None = None
+):
+    now = now or datetime.now(timezone.utc)
+    # Aggregate only the user's stacks, not every topic and card in the table
+    user_stack_ids = select(StudyStack.id).where(StudyStack.user_id == user_id)
+    topic_counts = (
+        db.query(Topic.stack_id, func.count(Topic.id).label("topic_count"))
+        .filter(Topic.stack_id.in_(user_stack_ids))
+        .group_by(Topic.stack_id)
+        .subquery()
+    )
+    card_counts = (
+        db.query(
+            Topic.stack_id,
+            func.count(Flashcard.id).label("flashcard_count"),
+            func.count(Flashcard.id).filter(flashcard_is_due(now)).label("due_count"),
+        )
+        .join(Flashcard, Flashcard.topic_id == Topic.id)
+        .outerjoin(FlashcardStats, FlashcardStats.flashcard_id == Flashcard.id)
+        .filter(Topic.stack_id.in_(user_stack_ids))
+        .group_by(Topic.stack_id)
+        .subquery()
+    )
+    rows = (
+        db.query(
+            StudyStack.id,
+            StudyStack.user_id,
+            StudyStack.name,
+            StudyStack.description,
+            func.coalesce(topic_counts.c.topic_count, 0).label("topic_count"),
+            func.coalesce(card_counts.c.flashcard_count, 0).label("flashcard_count"),
+            func.coalesce(card_counts.c.due_count, 0).label("due_count"),
+        )
+        .outerjoin(topic_counts, topic_counts.c.stack_id == StudyStack.id)
+        .outerjoin(card_counts, card_counts.c.stack_id == StudyStack.id)
+        .filter(StudyStack.user_id == user_id)
+        .all()
+    )
+    return [row._asdict() for row in rows]
+
+
 def create_stack(db: Session, user_id: uuid.UUID, name: str, description: str):
     stack = StudyStack(user_id=user_id, name=name, description=description)
     db.add(stack)
@@ -63,9 +233,17 @@ def create_stack(db: Session, user_id: uuid.UUID, name: str, description: str):
 # TOPICS
 
 
-def get_topics_by_stack_id(db: Session, stack_id: uuid.UUID, user_id: uuid.UUID):
+def get_topics_by_stack_id(
+    db: Session,
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    load_relations: bool = True,
+):
     get_stack_by_id(db, stack_id, user_id)
-    return db.query(Topic).filter(Topic.stack_id == stack_id).all()
+    query = db.query(Topic).filter(Topic.stack_id == stack_id)
+    if load_relations:
+        query = query.options(*TOPIC_TREE_LOADERS)
+    return query.all()
 
 
 def create_topic(
@@ -78,36 +256,59 @@ def create_topic(
     get_stack_by_id(db, stack_id, user_id)
     topic = Topic(stack_id=stack_id, name=name, description=description)
     db.add(topic)
+    db.flush()
+    refresh_topic_mastery(db, [topic.id])
     db.commit()
+    topic_graph.invalidate(stack_id)
     db.refresh(topic)
     return topic
 
 
 def get_topic_by_id(db: Session, topic_id: uuid.UUID, user_id: uuid.UUID):
-    topic = db.query(Topic).filter(Topic.id == topic_id).first()
-    if not topic:
-        raise ValueError("Topic not found")
-    get_stack_by_id(db, topic.stack_id, user_id)
-    return topic
+    return get_owned(db, Topic, topic_id, user_id)
 
 
 def get_topic_by_name(db: Session, topic_name: str, user_id: uuid.UUID):
-    topic = db.query(Topic).filter(Topic.name == topic_name).first()
+    topic = owned_query(db, Topic, user_id).filter(Topic.name == topic_name).first()
     if not topic:
         raise ValueError("Topic not found")
-    get_stack_by_id(db, topic.stack_id, user_id)
     return topic
 
 
+def get_topic_summaries_by_stack_id(
+    db: Session,
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    now: datetime | None = None,
+):
+    get_stack_by_id(db, stack_id, user_id)
+    now = now or datetime.now(timezone.utc)
+    rows = (
+        db.query(
+            Topic.id,
+            Topic.stack_id,
+            Topic.name,
+            Topic.description,
+            func.count(Flashcard.id).label("flashcard_count"),
+            func.count(Flashcard.id).filter(flashcard_is_due(now)).label("due_count"),
+        )
+        .outerjoin(Flashcard, Flashcard.topic_id == Topic.id)
+        .outerjoin(FlashcardStats, FlashcardStats.flashcard_id == Flashcard.id)
+        .filter(Topic.stack_id == stack_id)
+        .group_by(Topic.id)
+        .all()
+    )
+    return [row._asdict() for row in rows]
+
+
 def get_topics_with_prerequisites_by_stack_id(
     db: Session, stack_id: uuid.UUID, user_id: uuid.UUID
 ):
     get_stack_by_id(db, stack_id, user_id)
-    print("trying")
     return (
         db.query(Topic)
         .filter(Topic.stack_id == stack_id)
-        .options(selectinload(Topic.prerequisites))
+        .options(*TOPIC_TREE_LOADERS)
         .all()
     )
 
@@ -126,17 +327,149 @@ def update_topic(
     if description != topic.description:
         topic.description = description
     db.commit()
+    topic_graph.invalidate(topic.stack_id)
     db.refresh(topic)
     return topic
 
 
 def delete_topic(db: Session, topic_id: uuid.UUID, user_id: uuid.UUID):
     topic = get_topic_by_id(db, topic_id, user_id)
+    stack_id = topic.stack_id
     db.delete(topic)
     db.commit()
+    topic_graph.invalidate(stack_id)
     return True
 
 
+def save_topic_list(
+    db: Session,
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    new_topics: dict[str, str],
+    updated_topics: dict[uuid.UUID, tuple[str, str | None]],
+    deleted_topic_ids: list[uuid.UUID],
+) -> dict[str, uuid.UUID]:
+    """Apply a topic editor save in one transaction: create `new_topics`
+    ({name: description}), rename/redescribe `updated_topics` ({id: (name,
+    description)}) and delete `deleted_topic_ids`. The stack is authorized
+    once and every change is a single set-based statement. Returns the ids
+    of the created topics by name."""
+    get_stack_by_id(db, stack_id, user_id)
+    deleted = set(deleted_topic_ids)
+    updated = {id: v for id, v in updated_topics.items() if id not in deleted}
+
+    touched = deleted | set(updated)
+    if touched:
+        found = {
+            id
+            for (id,) in db.query(Topic.id).filter(
+                Topic.stack_id == stack_id, Topic.id.in_(touched)
+            )
+        }
+        if found != touched:
+            raise ValueError("Topic not found or does not belong to stack")
+
+    new_ids = _apply_topic_changes(
+        db, stack_id, list(new_topics.items()), updated, deleted
+    )
+    db.commit()
+    topic_graph.invalidate(stack_id)
+    return dict(zip(new_topics, new_ids))
+
+
+def _apply_topic_changes(
+    db: Session,
+    stack_id: uuid.UUID,
+    new_topics: list[tuple[str, str | None]],
+    updated_topics: dict[uuid.UUID, tuple[str, str | None]],
+    deleted_topic_ids: set[uuid.UUID],
+) -> list[uuid.UUID]:
+    """One statement per kind of change, without committing. The ids must
+    already be known to belong to the stack. Returns the new topics' ids."""
+    if deleted_topic_ids:
+        # Flashcards, dependencies and questions go with their topic through
+        # the ON DELETE rules on their foreign keys
+        db.execute(
+            delete(Topic).where(
+                Topic.stack_id == stack_id, Topic.id.in_(deleted_topic_ids)
+            ),
+            execution_options={"synchronize_session": False},
+        )
+    if updated_topics:
+        db.execute(
+            update(Topic),
+            [
+                {"id": id, "name": name, "description": description}
+                for id, (name, description) in updated_topics.items()
+            ],
+        )
+    new_ids = [uuid.uuid4() for _ in new_topics]
+    if new_ids:
+        db.execute(
+            insert(Topic),
+            [
+                {
+                    "id": id,
+                    "stack_id": stack_id,
+                    "name": name,
+                    "description": description,
+                }
+                for id, (name, description) in zip(new_ids, new_topics)
+            ],
+        )
+        refresh_topic_mastery(db, new_ids)
+    return new_ids
+
+
+def save_topic_graph(
+    db: Session,
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    topics: list[tuple[uuid.UUID | None, str, str | None]],
+    edges: set[tuple[uuid.UUID, uuid.UUID]],
+):
+    """Replace a stack's topics and prerequisite edges with the submitted
+    graph. The delta against the stored graph is computed in memory and
+    applied with a handful of bulk statements in one transaction."""
+    get_stack_by_id(db, stack_id, user_id)
+    stored_topics = {
+        id: (name, description)
+        for id, name, description in db.query(
+            Topic.id, Topic.name, Topic.description
+        ).filter(Topic.stack_id == stack_id)
+    }
+    stored_edges = set(
+        db.query(TopicDependency.from_topic_id, TopicDependency.to_topic_id)
+        .join(Topic, TopicDependency.to_topic_id == Topic.id)
+        .filter(Topic.stack_id == stack_id)
+        .tuples()
+    )
+    diff = topic_graph.diff_graph(stored_topics, stored_edges, topics, edges)
+    if diff.rejected_edges:
+        print(f"Skipping {len(diff.rejected_edges)} invalid topic dependencies")
+
+    _apply_topic_changes(
+        db, stack_id, diff.new_topics, diff.updated_topics, diff.deleted_topic_ids
+    )
+    if diff.deleted_edges:
+        db.execute(
+            delete(TopicDependency).where(
+                tuple_(TopicDependency.from_topic_id, TopicDependency.to_topic_id).in_(
+                    diff.deleted_edges
+                )
+            ),
+            execution_options={"synchronize_session": False},
+        )
+    if diff.new_edges:
+        db.execute(
+            insert(TopicDependency),
+            [{"from_topic_id": f, "to_topic_id": t} for f, t in diff.new_edges],
+        )
+    db.commit()
+    topic_graph.invalidate(stack_id)
+    return diff
+
+
 # FLASHCARDS
 
 
@@ -171,14 +504,19 @@ def get_flashcard_reviews_by_flashcard_id(
 
 
 def delete_flashcard_review(db: Session, review_id: uuid.UUID, user_id: uuid.UUID):
-    review = db.query(FlashcardReview).filter(FlashcardReview.id == review_id).first()
+    """Returns the id of the reviewed flashcard, whose stats must then be
+    rebuilt, or None if the review does not exist."""
+    review = (
+        owned_query(db, FlashcardReview, user_id)
+        .filter(FlashcardReview.id == review_id)
+        .first()
+    )
     if review:
-        if review.flashcard_id:
-            get_flashcard_by_id(db, review.flashcard_id, user_id)
+        flashcard_id = review.flashcard_id
         db.delete(review)
         db.commit()
-        return True
-    return False
+        return flashcard_id
+    return None
 
 
 # FLASHCARD STATS
@@ -192,11 +530,7 @@ def get_flashcard_stats(db: Session, flashcard_id: uuid.UUID, user_id: uuid.UUID
 
 
 def get_flashcard_by_id(db: Session, flashcard_id: uuid.UUID, user_id: uuid.UUID):
-    flashcard = db.query(Flashcard).filter(Flashcard.id == flashcard_id).first()
-    if not flashcard:
-        raise ValueError("Flashcard not found")
-    get_topic_by_id(db, flashcard.topic_id, user_id)
-    return flashcard
+    return get_owned(db, Flashcard, flashcard_id, user_id)
 
 
 def get_flashcards_by_stack_id(db: Session, stack_id: uuid.UUID, user_id: uuid.UUID):
@@ -204,6 +538,81 @@ def get_flashcards_by_stack_id(db: Session, stack_id: uuid.UUID, user_id: uuid.U
     return db.query(Flashcard).join(Topic).filter(Topic.stack_id == stack_id).all()
 
 
+# Orderings supported by the due queue. "due" serves the most overdue cards
+# first and never-reviewed cards last; "miss" serves the most frequently
+# missed cards first; "study" serves topics in prerequisite order (see
+# get_due_flashcards).
+DUE_QUEUE_ORDERINGS = {
+    "due": (FlashcardStats.due_date.asc().nulls_last(), Flashcard.id),
+    "miss": (
+        FlashcardStats.ewma_miss.desc().nulls_last(),
+        FlashcardStats.due_date.asc().nulls_last(),
+        Flashcard.id,
+    ),
+    "topic": (Topic.name, Flashcard.id),
+    "study": (FlashcardStats.due_date.asc().nulls_last(), Flashcard.id),
+}
+
+
+def flashcard_is_due(now: datetime):
+    """SQL predicate for a card being due, to be used with FlashcardStats
+    outer-joined onto Flashcard. Cards that have never been reviewed are due."""
+    return or_(
+        FlashcardStats.flashcard_id.is_(None),
+        FlashcardStats.due_date <= now,
+    )
+
+
+def get_due_flashcards(
+    db: Session,
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    order: str = "due",
+    limit: int | None = None,
+    offset: int = 0,
+    now: datetime | None = None,
+):
+    if order not in DUE_QUEUE_ORDERINGS:
+        raise ValueError(f"Unknown due queue ordering: {order}")
+    ordering = DUE_QUEUE_ORDERINGS[order]
+    if order == "study":
+        # Topic position in the cached topological order, then due date
+        position = {
+            id: i for i, id in enumerate(get_topic_graph(db, stack_id, user_id).order)
+        }
+        if position:
+            ordering = (case(position, value=Topic.id, else_=len(position)),) + ordering
+    else:
+        get_stack_by_id(db, stack_id, user_id)
+    now = now or datetime.now(timezone.utc)
+    query = (
+        db.query(Flashcard)
+        .join(Topic, Flashcard.topic_id == Topic.id)
+        .outerjoin(FlashcardStats, FlashcardStats.flashcard_id == Flashcard.id)
+        .filter(Topic.stack_id == stack_id, flashcard_is_due(now))
+        .order_by(*ordering)
+    )
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_missed_flashcards(
+    db: Session, stack_id: uuid.UUID, user_id: uuid.UUID, threshold: float = 0.4
+):
+    get_stack_by_id(db, stack_id, user_id)
+    return (
+        db.query(Flashcard)
+        .join(Topic, Flashcard.topic_id == Topic.id)
+        .join(FlashcardStats, FlashcardStats.flashcard_id == Flashcard.id)
+        .filter(Topic.stack_id == stack_id, FlashcardStats.ewma_miss > threshold)
+        .order_by(FlashcardStats.ewma_miss.desc(), Flashcard.id)
+        .all()
+    )
+
+
 def get_flashcards_by_topic_id(db: Session, topic_id: uuid.UUID, user_id: uuid.UUID):
     get_topic_by_id(db, topic_id, user_id)
     return db.query(Flashcard).filter(Flashcard.topic_id == topic_id).all()
@@ -215,6 +624,7 @@ def create_flashcard(
     get_topic_by_id(db, topic_id, user_id)
     flashcard = Flashcard(topic_id=topic_id, front=front, back=back)
     db.add(flashcard)
+    refresh_topic_mastery(db, [topic_id])
     db.commit()
     db.refresh(flashcard)
     return flashcard
@@ -233,6 +643,7 @@ def create_flashcard_with_explanation(
         topic_id=topic_id, front=front, back=back, explanation=explanation
     )
     db.add(flashcard)
+    refresh_topic_mastery(db, [topic_id])
     db.commit()
     db.refresh(flashcard)
     return flashcard
@@ -255,10 +666,36 @@ def create_flashcards_bulk(
         flashcards.append(Flashcard(topic_id=topic_id, front=front, back=back))
 
     db.add_all(flashcards)
+    refresh_topic_mastery(db, [topic_id])
     db.commit()
     return True
 
 
+def insert_flashcards(db: Session, cards: list[dict]) -> int:
+    """Insert cards (dicts of topic_id, front, back, explanation) with a single
+    bulk INSERT and commit. Ownership of the topics must already be checked."""
+    if not cards:
+        return 0
+    db.execute(insert(Flashcard), cards)
+    refresh_topic_mastery(db, list({card["topic_id"] for card in cards}))
+    db.commit()
+    return len(cards)
+
+
+def get_flashcard_fronts_by_stack_id(
+    db: Session, stack_id: uuid.UUID, user_id: uuid.UUID
+) -> dict[uuid.UUID, list[str]]:
+    get_stack_by_id(db, stack_id, user_id)
+    fronts = {}
+    for topic_id, front in (
+        db.query(Flashcard.topic_id, Flashcard.front)
+        .join(Topic, Flashcard.topic_id == Topic.id)
+        .filter(Topic.stack_id == stack_id)
+    ):
+        fronts.setdefault(topic_id, []).append(front)
+    return fronts
+
+
 def edit_flashcard(
     db: Session, id: uuid.UUID, front: str, back: str, user_id: uuid.UUID
 ):
@@ -274,7 +711,9 @@ def edit_flashcard(
 
 def delete_flashcard(db: Session, id: uuid.UUID, user_id: uuid.UUID):
     flashcard = get_flashcard_by_id(db, id, user_id)
+    topic_id = flashcard.topic_id
     db.delete(flashcard)
+    refresh_topic_mastery(db, [topic_id])
     db.commit()
     return True
 
@@ -306,6 +745,28 @@ def get_topic_dependencies_by_stack_id(
     )
 
 
+def get_topic_graph(
+    db: Session, stack_id: uuid.UUID, user_id: uuid.UUID
+) -> topic_graph.TopicGraph:
+    """The stack's prerequisite graph with its analytics, built from two
+    queries and cached per stack until a topic or dependency write."""
+    get_stack_by_id(db, stack_id, user_id)
+    graph = topic_graph.get_cached(stack_id)
+    if graph is None:
+        names = dict(
+            db.query(Topic.id, Topic.name).filter(Topic.stack_id == stack_id).tuples()
+        )
+        edges = set(
+            db.query(TopicDependency.from_topic_id, TopicDependency.to_topic_id)
+            .join(Topic, TopicDependency.to_topic_id == Topic.id)
+            .filter(Topic.stack_id == stack_id)
+            .tuples()
+        )
+        graph = topic_graph.TopicGraph(names, edges)
+        topic_graph.cache_graph(stack_id, graph)
+    return graph
+
+
 def get_prerequisite_topic_ids(db: Session, topic_id: uuid.UUID, user_id: uuid.UUID):
     get_topic_by_id(db, topic_id, user_id)
     dependencies = (
@@ -327,40 +788,89 @@ def get_postrequisite_topic_ids(db: Session, topic_id: uuid.UUID, user_id: uuid.
 def add_topic_dependency(
     db: Session, from_topic_id: uuid.UUID, to_topic_id: uuid.UUID, user_id: uuid.UUID
 ):
-    get_topic_by_id(db, from_topic_id, user_id)
-    get_topic_by_id(db, to_topic_id, user_id)
+    topics = get_owned_many(db, Topic, {from_topic_id, to_topic_id}, user_id)
 
     topic_dependency = TopicDependency(
         from_topic_id=from_topic_id, to_topic_id=to_topic_id
     )
     db.add(topic_dependency)
     db.commit()
+    topic_graph.invalidate(*{t.stack_id for t in topics})
     return True
 
 
 def add_topic_dependency_by_name(
     db: Session, from_topic_name: str, to_topic_name: str, user_id: uuid.UUID
 ):
-    from_topic = db.query(Topic).filter(Topic.name == from_topic_name).first()
-    to_topic = db.query(Topic).filter(Topic.name == to_topic_name).first()
+    from_topic = (
+        owned_query(db, Topic, user_id).filter(Topic.name == from_topic_name).first()
+    )
+    to_topic = (
+        owned_query(db, Topic, user_id).filter(Topic.name == to_topic_name).first()
+    )
 
     if not from_topic or not to_topic:
         raise ValueError("Topic not found or does not belong to user")
 
-    if from_topic.stack.user_id != user_id or to_topic.stack.user_id != user_id:
-        raise ValueError("One or more topics do not belong to user")
-
     if from_topic and to_topic:
         topic_dependency = TopicDependency(
             from_topic_id=from_topic.id, to_topic_id=to_topic.id
         )
         db.add(topic_dependency)
         db.commit()
+        topic_graph.invalidate(from_topic.stack_id, to_topic.stack_id)
         return topic_dependency
     else:
         return None
 
 
+def add_topic_dependencies_by_name(
+    db: Session,
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    pairs: list[tuple[str, str]],
+) -> list[tuple[uuid.UUID, uuid.UUID]]:
+    """Bulk-ingest (from_name, to_name) prerequisite edges for one stack in a
+    constant number of queries. Names are resolved against the stack's
+    topics in memory; unknown names, duplicates, existing edges and edges
+    that would create a cycle are skipped. Returns the inserted edges."""
+    get_stack_by_id(db, stack_id, user_id)
+    ids_by_name = {
+        name: id
+        for id, name in db.query(Topic.id, Topic.name).filter(
+            Topic.stack_id == stack_id
+        )
+    }
+    existing = set(
+        db.query(TopicDependency.from_topic_id, TopicDependency.to_topic_id)
+        .join(Topic, TopicDependency.to_topic_id == Topic.id)
+        .filter(Topic.stack_id == stack_id)
+        .tuples()
+    )
+    candidates = [
+        (ids_by_name[from_name], ids_by_name[to_name])
+        for from_name, to_name in pairs
+        # Names come from the LLM, which may return something other than a
+        # string; those are skipped like unknown names
+        if isinstance(from_name, str)
+        and isinstance(to_name, str)
+        and from_name in ids_by_name
+        and to_name in ids_by_name
+    ]
+    accepted, rejected = topic_graph.add_acyclic_edges(existing, candidates)
+    if rejected:
+        print(f"Skipping {len(rejected)} topic dependencies that would form a cycle")
+    if accepted:
+        db.execute(
+            pg_insert(TopicDependency)
+            .values([{"from_topic_id": f, "to_topic_id": t} for f, t in accepted])
+            .on_conflict_do_nothing()
+        )
+        db.commit()
+        topic_graph.invalidate(stack_id)
+    return accepted
+
+
 def update_topic_dependency(
     db: Session,
     from_id: uuid.UUID,
@@ -370,33 +880,27 @@ def update_topic_dependency(
     user_id: uuid.UUID,
 ):
     dependency = (
-        db.query(TopicDependency)
+        owned_query(db, TopicDependency, user_id)
         .filter(
-            TopicDependency.from_topic_id == from_id
-            and TopicDependency.to_topic_id == to_id
+            TopicDependency.from_topic_id == from_id,
+            TopicDependency.to_topic_id == to_id,
         )
         .first()
     )
     if not dependency:
         raise ValueError("Dependency not found")
 
-    from_topic = (
-        db.query(Topic)
-        .filter(Topic.name == new_from, Topic.stack.user_id == user_id)
-        .first()
-    )
-    to_topic = (
-        db.query(Topic)
-        .filter(Topic.id == new_to, Topic.stack.user_id == user_id)
-        .first()
-    )
+    from_topic = owned_query(db, Topic, user_id).filter(Topic.name == new_from).first()
+    to_topic = owned_query(db, Topic, user_id).filter(Topic.id == new_to).first()
 
     if not from_topic or not to_topic:
         raise ValueError("One or more topics not found or do not belong to user")
 
+    old_stack_id = dependency.to_topic.stack_id
     dependency.from_topic_id = from_topic.id
     dependency.to_topic_id = to_topic.id
     db.commit()
+    topic_graph.invalidate(old_stack_id, from_topic.stack_id, to_topic.stack_id)
     return True
 
 
@@ -404,24 +908,20 @@ def delete_topic_dependency(
     db: Session, from_id: uuid.UUID, to_id: uuid.UUID, user_id: uuid.UUID
 ):
     dependency = (
-        db.query(TopicDependency)
+        owned_query(db, TopicDependency, user_id)
         .filter(
-            TopicDependency.from_topic_id == from_id
-            and TopicDependency.to_topic_id == to_id
+            TopicDependency.from_topic_id == from_id,
+            TopicDependency.to_topic_id == to_id,
         )
         .first()
     )
     if not dependency:
-        raise ValueError("Dependency not found")
-
-    if (
-        dependency.from_topic.stack.user_id != user_id
-        or dependency.to_topic.stack.user_id != user_id
-    ):
-        raise ValueError("Dependency does not belong to user")
+        raise ValueError("Dependency not found or does not belong to user")
 
+    stack_id = dependency.to_topic.stack_id
     db.delete(dependency)
     db.commit()
+    topic_graph.invalidate(stack_id)
     return True
 
 
@@ -436,6 +936,52 @@ def create_exam(db: Session, stack_id: uuid.UUID, name: str, user_id: uuid.UUID)
     return exam
 
 
+def create_exam_with_questions(
+    db: Session,
+    stack_id: uuid.UUID,
+    name: str,
+    questions: list[dict],
+    user_id: uuid.UUID,
+):
+    """Insert an exam and all of its questions in one transaction. Each
+    question is a dict of text, option_a..option_d, answer and topic_name;
+    topic names are resolved against the stack in a single query, and a
+    name that matches no topic (or is not a string) leaves the question
+    without one."""
+    get_stack_by_id(db, stack_id, user_id)
+    ids_by_name = dict(
+        db.query(Topic.name, Topic.id).filter(Topic.stack_id == stack_id).tuples()
+    )
+    exam = Exam(stack_id=stack_id, name=name)
+    db.add(exam)
+    db.flush()
+    if questions:
+        db.execute(
+            insert(Question),
+            [
+                {
+                    "exam_id": exam.id,
+                    "text": q["text"],
+                    "option_a": q["option_a"],
+                    "option_b": q["option_b"],
+                    "option_c": q["option_c"],
+                    "option_d": q["option_d"],
+                    "answer": q["answer"],
+                    "topic_id": (
+                        ids_by_name.get(q["topic_name"])
+                        if isinstance(q["topic_name"], str)
+                        else None
+                    ),
+                    "order": i,
+                }
+                for i, q in enumerate(questions)
+            ],
+        )
+    db.commit()
+    db.refresh(exam)
+    return exam
+
+
 def get_exams_by_stack(db: Session, stack_id: uuid.UUID, user_id: uuid.UUID):
     get_stack_by_id(db, stack_id, user_id)
     return db.query(Exam).filter(Exam.stack_id == stack_id).all()
@@ -459,43 +1005,73 @@ def get_exam_with_topics(db: Session, exam_id: uuid.UUID, user_id: uuid.UUID):
 def get_exams_by_stack_with_topics(
     db: Session, stack_id: uuid.UUID, user_id: uuid.UUID
 ):
-    exams = get_exams_by_stack(db, stack_id, user_id)
-    result = []
-    for exam in exams:
-        topics = (
-            db.query(Topic.name)
-            .join(Question, Question.topic_id == Topic.id)
-            .filter(Question.exam_id == exam.id)
-            .distinct()
-            .all()
-        )
-        topic_names = [t[0] for t in topics]
-        exam_dict = exam.__dict__.copy()
-        exam_dict["topics"] = topic_names
-
-        attempts = db.query(ExamAttempt).filter(ExamAttempt.exam_id == exam.id).all()
-        if attempts:
-            best_attempt = max(
-                attempts, key=lambda a: (a.score or 0, a.scored_questions or 0)
+    """The stack's exams with the names of the topics their questions cover
+    and their best attempt (highest score, then most scored questions, then
+    earliest), all in one query."""
+    get_stack_by_id(db, stack_id, user_id)
+    stack_exam_ids = select(Exam.id).where(Exam.stack_id == stack_id)
+    exam_topics = (
+        select(
+            Question.exam_id,
+            func.array_agg(Topic.name.distinct()).label("names"),
+        )
+        .join(Topic, Question.topic_id == Topic.id)
+        .where(Question.exam_id.in_(stack_exam_ids))
+        .group_by(Question.exam_id)
+        .subquery()
+    )
+    ranked_attempts = (
+        select(
+            ExamAttempt,
+            func.row_number()
+            .over(
+                partition_by=ExamAttempt.exam_id,
+                order_by=(
+                    func.coalesce(ExamAttempt.score, 0).desc(),
+                    func.coalesce(ExamAttempt.scored_questions, 0).desc(),
+                    ExamAttempt.completed_at,
+                ),
             )
-            exam_dict["best_attempt"] = best_attempt
-        else:
-            exam_dict["best_attempt"] = None
-        result.append(exam_dict)
-    return result
+            .label("rank"),
+        )
+        .where(ExamAttempt.exam_id.in_(stack_exam_ids))
+        .subquery()
+    )
+    best_attempt = aliased(ExamAttempt, ranked_attempts)
+    rows = (
+        db.query(Exam, exam_topics.c.names, best_attempt)
+        .outerjoin(exam_topics, exam_topics.c.exam_id == Exam.id)
+        .outerjoin(
+            best_attempt,
+            and_(ranked_attempts.c.exam_id == Exam.id, ranked_attempts.c.rank == 1),
+        )
+        .filter(Exam.stack_id == stack_id)
+        .order_by(Exam.created_at)
+        .all()
+    )
+    return [
+        {
+            "id": exam.id,
+            "stack_id": exam.stack_id,
+            "name": exam.name,
+            "created_at": exam.created_at,
+            "topics": topic_names or [],
+            "best_attempt": attempt,
+        }
+        for exam, topic_names, attempt in rows
+    ]
 
 
 def get_exam_by_id(db: Session, exam_id: uuid.UUID, user_id: uuid.UUID):
-    exam = db.query(Exam).filter(Exam.id == exam_id).first()
-    if not exam:
-        raise ValueError("Exam not found")
-    get_stack_by_id(db, exam.stack_id, user_id)
-    return exam
+    return get_owned(db, Exam, exam_id, user_id)
 
 
 def delete_exam(db: Session, exam_id: uuid.UUID, user_id: uuid.UUID):
     exam = get_exam_by_id(db, exam_id, user_id)
+    # Read before the questions cascade away with the exam
+    topic_ids = [topic_id for (topic_id,) in db.execute(_exam_topic_ids(exam_id))]
     db.delete(exam)
+    refresh_topic_mastery(db, topic_ids)
     db.commit()
     return True
 
@@ -532,11 +1108,7 @@ def create_question(
 
 
 def get_question_by_id(db: Session, question_id: uuid.UUID, user_id: uuid.UUID):
-    question = db.query(Question).filter(Question.id == question_id).first()
-    if not question:
-        raise ValueError("Question not found")
-    get_exam_by_id(db, question.exam_id, user_id)
-    return question
+    return get_owned(db, Question, question_id, user_id)
 
 
 def get_questions_by_stack(db: Session, stack_id: uuid.UUID, user_id: uuid.UUID):
@@ -574,7 +1146,10 @@ def update_question(
 
 def delete_question(db: Session, question_id: uuid.UUID, user_id: uuid.UUID):
     question = get_question_by_id(db, question_id, user_id)
+    topic_id = question.topic_id
     db.delete(question)
+    if topic_id:
+        refresh_topic_mastery(db, [topic_id])
     db.commit()
     return True
 
@@ -593,40 +1168,127 @@ def create_exam_attempt(db: Session, exam_id: uuid.UUID, user_id: uuid.UUID):
     return exam_attempt
 
 
-def get_exam_attempt_by_id(db: Session, attempt_id: uuid.UUID, user_id: uuid.UUID):
-    exam_attempt = db.query(ExamAttempt).filter(ExamAttempt.id == attempt_id).first()
-    if not exam_attempt:
-        raise ValueError("Exam attempt not found")
-    get_exam_by_id(db, exam_attempt.exam_id, user_id)
+def create_graded_exam_attempt(
+    db: Session, exam_id: uuid.UUID, answers: list[dict], user_id: uuid.UUID
+):
+    """Record a finished attempt in one transaction. `answers` holds dicts of
+    question_id and selected_option; they are graded in memory against the
+    exam's answer key, which is loaded once."""
+    get_exam_by_id(db, exam_id, user_id)
+    answer_key = dict(
+        db.query(Question.id, Question.answer)
+        .filter(Question.exam_id == exam_id)
+        .tuples()
+    )
+    rows = []
+    for answer in answers:
+        question_id = uuid.UUID(str(answer["question_id"]))
+        if question_id not in answer_key:
+            raise ValueError("Question not found")
+        rows.append(
+            {
+                "question_id": question_id,
+                "selected_option": answer["selected_option"],
+                "is_correct": answer["selected_option"] == answer_key[question_id],
+            }
+        )
+    exam_attempt = ExamAttempt(
+        exam_id=exam_id,
+        scored_questions=len(rows),
+        score=sum(row["is_correct"] for row in rows),
+    )
+    db.add(exam_attempt)
+    db.flush()
+    if rows:
+        db.execute(
+            insert(QuestionAttempt),
+            [{**row, "exam_attempt_id": exam_attempt.id} for row in rows],
+        )
+    refresh_topic_mastery(db, _exam_topic_ids(exam_id))
+    db.commit()
     return exam_attempt
 
 
+def get_exam_attempt_by_id(db: Session, attempt_id: uuid.UUID, user_id: uuid.UUID):
+    return get_owned(db, ExamAttempt, attempt_id, user_id)
+
+
 def get_exam_attempts(db: Session, exam_id: uuid.UUID, user_id: uuid.UUID):
     get_exam_by_id(db, exam_id, user_id)
     return db.query(ExamAttempt).filter(ExamAttempt.exam_id == exam_id).all()
 
 
+def _rescore_exam_attempt(db: Session, attempt_id: uuid.UUID):
+    """Recompute an attempt's score from its question attempts in a single
+    UPDATE. Does not commit."""
+    counted = QuestionAttempt.exam_attempt_id == ExamAttempt.id
+    db.execute(
+        update(ExamAttempt)
+        .where(ExamAttempt.id == attempt_id)
+        .values(
+            scored_questions=select(func.count(QuestionAttempt.id))
+            .where(counted, QuestionAttempt.scored)
+            .scalar_subquery(),
+            score=select(func.count(QuestionAttempt.id))
+            .where(
+                counted,
+                QuestionAttempt.scored,
+                or_(QuestionAttempt.manual_credit, QuestionAttempt.is_correct),
+            )
+            .scalar_subquery(),
+        ),
+        execution_options={"synchronize_session": False},
+    )
+
+
 def score_exam_attempt(db: Session, attempt_id: uuid.UUID, user_id: uuid.UUID):
     exam_attempt = get_exam_attempt_by_id(db, attempt_id, user_id)
-    question_attempts = get_question_attempts_by_exam_attempt(
-        db, exam_attempt.id, user_id
-    )
-    total_scored_questions = 0
-    total_score = 0
-    for q in question_attempts:
-        if q.scored:
-            total_scored_questions += 1
-            if q.manual_credit or q.is_correct:
-                total_score += 1
-    exam_attempt.score = total_score
-    exam_attempt.scored_questions = total_scored_questions
+    _rescore_exam_attempt(db, attempt_id)
+    db.commit()
+    return exam_attempt
+
+
+def update_exam_attempt_scoring(
+    db: Session, attempt_id: uuid.UUID, changes: list[dict], user_id: uuid.UUID
+):
+    """Apply scored/manual_credit overrides to question attempts of one exam
+    attempt and rescore it, in one transaction. `changes` holds validated
+    dicts of question_attempt_id (a UUID), scored and manual_credit (bools)."""
+    exam_attempt = get_exam_attempt_by_id(db, attempt_id, user_id)
+    overrides = {change["question_attempt_id"]: change for change in changes}
+    if overrides:
+        result = db.execute(
+            update(QuestionAttempt)
+            .where(
+                QuestionAttempt.exam_attempt_id == attempt_id,
+                QuestionAttempt.id.in_(overrides),
+            )
+            .values(
+                scored=case(
+                    {id: c["scored"] for id, c in overrides.items()},
+                    value=QuestionAttempt.id,
+                ),
+                manual_credit=case(
+                    {id: c["manual_credit"] for id, c in overrides.items()},
+                    value=QuestionAttempt.id,
+                ),
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount != len(overrides):
+            db.rollback()
+            raise ValueError("Question attempt not found")
+        refresh_topic_mastery(db, _exam_topic_ids(exam_attempt.exam_id))
+    _rescore_exam_attempt(db, attempt_id)
     db.commit()
     return exam_attempt
 
 
 def delete_exam_attempt(db: Session, attempt_id: uuid.UUID, user_id: uuid.UUID):
     exam_attempt = get_exam_attempt_by_id(db, attempt_id, user_id)
+    exam_id = exam_attempt.exam_id
     db.delete(exam_attempt)
+    refresh_topic_mastery(db, _exam_topic_ids(exam_id))
     db.commit()
     return True
 
@@ -639,8 +1301,14 @@ def create_question_attempt(
     selected_option: str,
     user_id: uuid.UUID,
 ):
-    get_exam_attempt_by_id(db, exam_attempt_id, user_id)
-    question = get_question_by_id(db, question_id, user_id)
+    exam_attempt = get_exam_attempt_by_id(db, exam_attempt_id, user_id)
+    question = (
+        db.query(Question)
+        .filter(Question.id == question_id, Question.exam_id == exam_attempt.exam_id)
+        .first()
+    )
+    if not question:
+        raise ValueError("Question not found")
     question_attempt = QuestionAttempt(
         exam_attempt_id=exam_attempt_id,
         question_id=question_id,
@@ -648,6 +1316,8 @@ def create_question_attempt(
         is_correct=(selected_option == question.answer),
     )
     db.add(question_attempt)
+    if question.topic_id:
+        refresh_topic_mastery(db, [question.topic_id])
     db.commit()
     return question_attempt
 
@@ -655,16 +1325,7 @@ def create_question_attempt(
 def get_question_attempt_by_id(
     db: Session, question_attempt_id: uuid.UUID, user_id: uuid.UUID
 ):
-    question_attempt = (
-        db.query(QuestionAttempt)
-        .filter(QuestionAttempt.id == question_attempt_id)
-        .first()
-    )
-    if not question_attempt:
-        raise ValueError("Question attempt not found")
-    get_exam_attempt_by_id(db, question_attempt.exam_attempt_id, user_id)
-    get_question_by_id(db, question_attempt.question_id, user_id)
-    return question_attempt
+    return get_owned(db, QuestionAttempt, question_attempt_id, user_id)
 
 
 def get_question_attempts_by_exam_attempt(
@@ -688,6 +1349,10 @@ def update_question_attempt_scoring(
     question_attempt = get_question_attempt_by_id(db, question_attempt_id, user_id)
     question_attempt.scored = scored
     question_attempt.manual_credit = manual_credit
+    refresh_topic_mastery(
+        db,
+        select(Question.topic_id).where(Question.id == question_attempt.question_id),
+    )
     db.commit()
     return question_attempt
 
@@ -743,6 +1408,15 @@ def delete_chat_session(db: Session, chat_id: uuid.UUID, user_id: uuid.UUID) ->
     db.commit()
 
 
+def update_chat_title(
+    db: Session, chat_id: uuid.UUID, user_id: uuid.UUID, title: str
+) -> ChatSession:
+    chat = get_owned(db, ChatSession, chat_id, user_id)
+    chat.title = title
+    db.commit()
+    return chat
+
+
 def add_message_to_chat(
     db: Session, chat_id: uuid.UUID, user_id: uuid.UUID, role: str, content: str
 ) -> ChatMessage:
@@ -798,33 +1472,355 @@ def hydrate_attachments(
 ) -> list[dict]:
     chat = get_chat_by_id(db, chat_id, user_id)
 
+    # Resolve every attachment with one ownership-scoped query per type
+    ref_ids = {}
+    for att in chat.attachments:
+        ref_ids.setdefault(att.type, set()).add(att.ref_id)
+    refs = {}
+    for type, model in (
+        ("exam_question", Question),
+        ("flashcard", Flashcard),
+        ("topic", Topic),
+    ):
+        if type in ref_ids:
+            refs[type] = {
+                row.id: row
+                for row in owned_query(db, model, user_id).filter(
+                    model.id.in_(ref_ids[type])
+                )
+            }
+
     hydrated = []
     for att in chat.attachments:
+        ref = refs.get(att.type, {}).get(att.ref_id)
+        if not ref:
+            continue
         if att.type == "exam_question":
-            q = db.query(Question).filter(Question.id == att.ref_id).first()
-            if q:
-                hydrated.append(
-                    {
-                        "type": "exam_question",
-                        "text": f"{q.text}\nA: {q.option_a}\nB: {q.option_b}\nC: {q.option_c}\nD: {q.option_d}\nCorrect Answer: {q.answer}",
-                    }
-                )
+            text = f"{ref.text}\nA: {ref.option_a}\nB: {ref.option_b}\nC: {ref.option_c}\nD: {ref.option_d}\nCorrect Answer: {ref.answer}"
         elif att.type == "flashcard":
-            f = db.query(Flashcard).filter(Flashcard.id == att.ref_id).first()
-            if f:
-                hydrated.append(
-                    {
-                        "type": "flashcard",
-                        "text": f"Front: {f.front}\nBack: {f.back}\nExplanation: {f.explanation or ''}",
-                    }
-                )
-        elif att.type == "topic":
-            t = db.query(Topic).filter(Topic.id == att.ref_id).first()
-            if t:
-                hydrated.append(
-                    {
-                        "type": "topic",
-                        "text": f"Topic: {t.name}\nDescription: {t.description or ''}",
-                    }
-                )
+            text = f"Front: {ref.front}\nBack: {ref.back}\nExplanation: {ref.explanation or ''}"
+        else:
+            text = f"Topic: {ref.name}\nDescription: {ref.description or ''}"
+        hydrated.append({"type": att.type, "text": text})
     return hydrated
+
+
+# GENERATION JOBS
+
+JOB_ACTIVE_STATUSES = ("queued", "running")
+
+
+def create_job(
+    db: Session,
+    user_id: uuid.UUID,
+    kind: str,
+    params: dict,
+    max_active: int | None = None,
+):
+    """Insert a queued job. With `max_active`, returns None instead when the
+    user already has that many active jobs. The user's row stays locked from
+    the count to the commit, so concurrent requests take the last slot one at
+    a time."""
+    if max_active is not None:
+        db.query(User.id).filter(User.id == user_id).with_for_update().first()
+        if count_active_jobs(db, user_id) >= max_active:
+            db.rollback()
+            return None
+    job = GenerationJob(user_id=user_id, kind=kind, params=params, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job_by_id(db: Session, job_id: uuid.UUID, user_id: uuid.UUID):
+    job = (
+        db.query(GenerationJob)
+        .filter(GenerationJob.id == job_id, GenerationJob.user_id == user_id)
+        .first()
+    )
+    if not job:
+        raise ValueError("GenerationJob not found or does not belong to user")
+    return job
+
+
+def list_jobs(db: Session, user_id: uuid.UUID, limit: int = 50):
+    return (
+        db.query(GenerationJob)
+        .filter(GenerationJob.user_id == user_id)
+        .order_by(GenerationJob.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def count_active_jobs(db: Session, user_id: uuid.UUID) -> int:
+    return (
+        db.query(func.count(GenerationJob.id))
+        .filter(
+            GenerationJob.user_id == user_id,
+            GenerationJob.status.in_(JOB_ACTIVE_STATUSES),
+        )
+        .scalar()
+    )
+
+
+# Status changes are conditional on the current status, so a job that has
+# already been finalized (e.g. failed as stale) is never moved back; each
+# returns whether the transition happened.
+
+
+def mark_job_running(db: Session, job_id: uuid.UUID) -> bool:
+    updated = (
+        db.query(GenerationJob)
+        .filter(GenerationJob.id == job_id, GenerationJob.status == "queued")
+        .update(
+            {"status": "running", "started_at": datetime.now(timezone.utc)},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return updated == 1
+
+
+def finish_job(
+    db: Session, job_id: uuid.UUID, result=None, error: str | None = None
+) -> bool:
+    updated = (
+        db.query(GenerationJob)
+        .filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status.in_(JOB_ACTIVE_STATUSES),
+        )
+        .update(
+            {
+                "status": "failed" if error is not None else "succeeded",
+                "result": result,
+                "error": error,
+                "finished_at": datetime.now(timezone.utc),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return updated == 1
+
+
+def fail_stale_jobs(
+    db: Session,
+    started_before: datetime,
+    queued_before: datetime,
+    user_id: uuid.UUID | None = None,
+    exclude_ids=(),
+) -> int:
+    """Fail jobs lost with the worker that owned them: running jobs started
+    before `started_before` and queued jobs created before `queued_before`.
+    `exclude_ids` are jobs the calling process still owns."""
+    query = db.query(GenerationJob).filter(
+        or_(
+            and_(
+                GenerationJob.status == "running",
+                GenerationJob.started_at < started_before,
+            ),
+            and_(
+                GenerationJob.status == "queued",
+                GenerationJob.created_at < queued_before,
+            ),
+        )
+    )
+    if user_id is not None:
+        query = query.filter(GenerationJob.user_id == user_id)
+    if exclude_ids:
+        query = query.filter(GenerationJob.id.not_in(exclude_ids))
+    count = query.update(
+        {
+            "status": "failed",
+            "error": "Job was interrupted before it finished",
+            "finished_at": datetime.now(timezone.utc),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return count
+
+
+# TOPIC MASTERY
+
+
+def _topic_mastery_select(topic_ids):
+    """SELECT of each topic's id, stack_id and mastery columns, computed from
+    its cards and exam answers. Only `topic_ids` are scanned."""
+    cards = (
+        select(
+            Flashcard.topic_id,
+            func.count(Flashcard.id).label("flashcard_count"),
+            func.count(FlashcardStats.flashcard_id).label("reviewed_count"),
+            func.sum(FlashcardStats.ease).label("ease_sum"),
+            func.sum(FlashcardStats.ewma_miss).label("ewma_miss_sum"),
+            func.count(FlashcardStats.ewma_miss).label("ewma_miss_count"),
+        )
+        .outerjoin(FlashcardStats, FlashcardStats.flashcard_id == Flashcard.id)
+        .where(Flashcard.topic_id.in_(topic_ids))
+        .group_by(Flashcard.topic_id)
+        .subquery()
+    )
+    answers = (
+        select(
+            Question.topic_id,
+            func.count(QuestionAttempt.id).label("answered_count"),
+            func.count(QuestionAttempt.id)
+            .filter(or_(QuestionAttempt.manual_credit, QuestionAttempt.is_correct))
+            .label("correct_count"),
+        )
+        .join(Question, QuestionAttempt.question_id == Question.id)
+        .where(Question.topic_id.in_(topic_ids), QuestionAttempt.scored)
+        .group_by(Question.topic_id)
+        .subquery()
+    )
+    counts = [
+        func.coalesce(column, 0).label(column.name)
+        for column in (*list(cards.c)[1:], *list(answers.c)[1:])
+    ]
+    return (
+        select(Topic.id, Topic.stack_id, *counts)
+        .outerjoin(cards, cards.c.topic_id == Topic.id)
+        .outerjoin(answers, answers.c.topic_id == Topic.id)
+        .where(Topic.id.in_(topic_ids))
+    )
+
+
+def refresh_topic_mastery(db: Session, topic_ids):
+    """Recompute the mastery rows of `topic_ids` (a list of ids or a SELECT of
+    them) from their cards and exam answers, upserting them in one statement.
+    Only those topics are scanned, so a review or attempt costs the same
+    however large the stack is. Flushes pending changes first; does not
+    commit.
+
+    The topics' rows are locked first and held until commit, so concurrent
+    writes to one topic recompute one after the other, each seeing what the
+    one before committed; otherwise under READ COMMITTED the later upsert
+    could overwrite the earlier one with counts read before it. FOR NO KEY
+    UPDATE, in id order, does not block the key-share locks taken by inserts
+    of cards and questions, so it cannot deadlock with them."""
+    if isinstance(topic_ids, (list, set, tuple)) and not topic_ids:
+        return
+    db.flush()
+    db.execute(
+        select(Topic.id)
+        .where(Topic.id.in_(topic_ids))
+        .order_by(Topic.id)
+        .with_for_update(key_share=True)
+    )
+    mastery = _topic_mastery_select(topic_ids)
+    columns = list(mastery.selected_columns.keys())[2:]
+    stmt = pg_insert(TopicMastery).from_select(
+        ["topic_id", "stack_id", *columns, "updated_at"],
+        mastery.add_columns(func.now()),
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[TopicMastery.topic_id],
+            set_={name: stmt.excluded[name] for name in (*columns, "updated_at")},
+        )
+    )
+
+
+def backfill_topic_mastery(db: Session) -> int:
+    """Create the mastery rows missing for topics that predate the table.
+    Topics created since get theirs when they are written."""
+    missing = select(Topic.id).where(
+        ~select(TopicMastery.topic_id).where(TopicMastery.topic_id == Topic.id).exists()
+    )
+    count = db.query(func.count()).select_from(missing.subquery()).scalar()
+    if count:
+        refresh_topic_mastery(db, missing)
+        db.commit()
+    return count
+
+
+def _exam_topic_ids(exam_id: uuid.UUID):
+    return select(Question.topic_id).where(Question.exam_id == exam_id)
+
+
+def _mastery_summary(row) -> dict:
+    return {
+        "flashcard_count": row["flashcard_count"],
+        "reviewed_count": row["reviewed_count"],
+        "due_count": row["due_count"],
+        "mean_ease": (
+            row["ease_sum"] / row["reviewed_count"] if row["reviewed_count"] else None
+        ),
+        "mean_ewma_miss": (
+            row["ewma_miss_sum"] / row["ewma_miss_count"]
+            if row["ewma_miss_count"]
+            else None
+        ),
+        "answered_count": row["answered_count"],
+        "exam_accuracy": (
+            row["correct_count"] / row["answered_count"]
+            if row["answered_count"]
+            else None
+        ),
+    }
+
+
+def get_stack_mastery(
+    db: Session,
+    stack_id: uuid.UUID,
+    user_id: uuid.UUID,
+    now: datetime | None = None,
+):
+    """Mastery of every topic in the stack, and of the stack as a whole, read
+    from topic_mastery. Due counts depend on the time of the request, so they
+    are counted here rather than stored. Read-only: topics without a mastery
+    row yet are computed from their cards and answers without storing it."""
+    get_stack_by_id(db, stack_id, user_id)
+    now = now or datetime.now(timezone.utc)
+    due_counts = (
+        select(Flashcard.topic_id, func.count(Flashcard.id).label("due_count"))
+        .join(Topic, Flashcard.topic_id == Topic.id)
+        .outerjoin(FlashcardStats, FlashcardStats.flashcard_id == Flashcard.id)
+        .where(Topic.stack_id == stack_id, flashcard_is_due(now))
+        .group_by(Flashcard.topic_id)
+        .subquery()
+    )
+    rows = (
+        db.query(
+            Topic.id,
+            Topic.name,
+            TopicMastery,
+            func.coalesce(due_counts.c.due_count, 0),
+        )
+        .outerjoin(TopicMastery, TopicMastery.topic_id == Topic.id)
+        .outerjoin(due_counts, due_counts.c.topic_id == Topic.id)
+        .filter(Topic.stack_id == stack_id)
+        .order_by(Topic.name, Topic.id)
+        .all()
+    )
+
+    summed = (
+        "flashcard_count",
+        "reviewed_count",
+        "due_count",
+        "ease_sum",
+        "ewma_miss_sum",
+        "ewma_miss_count",
+        "answered_count",
+        "correct_count",
+    )
+    missing = [topic_id for topic_id, _, mastery, _ in rows if mastery is None]
+    computed = (
+        {row.id: row for row in db.execute(_topic_mastery_select(missing))}
+        if missing
+        else {}
+    )
+    totals = dict.fromkeys(summed, 0)
+    topics = []
+    for topic_id, name, mastery, due_count in rows:
+        mastery = mastery or computed[topic_id]
+        row = {key: getattr(mastery, key, 0) for key in summed}
+        row["due_count"] = due_count
+        for key in summed:
+            totals[key] += row[key]
+        topics.append({"topic_id": topic_id, "name": name, **_mastery_summary(row)})
+    return {"stack_id": stack_id, **_mastery_summary(totals), "topics": topics}
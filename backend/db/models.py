@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from typing import List
-from sqlalchemy import String, Text, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import JSON, String, Text, DateTime, ForeignKey, CheckConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
@@ -410,3 +410,80 @@ class ChatTag(Base):
     tag: Mapped[str] = mapped_column(String(64), nullable=False)
 
     chat_session: Mapped["ChatSession"] = relationship(back_populates="tags")
+
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache_entries"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    response: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now()
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(16),
+        CheckConstraint(
+            "status IN ('queued', 'running', 'succeeded', 'failed')",
+            name="check_job_status",
+        ),
+        nullable=False,
+        default="queued",
+    )
+    params: Mapped[dict] = mapped_column(JSON, nullable=False)
+    result: Mapped[dict | list | None] = mapped_column(JSON)
+    error: Mapped[str | None] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now()
+    )
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class TopicMastery(Base):
+    """Per-topic aggregates of flashcard stats and exam answers, kept current
+    by the writes that change them (see crud.refresh_topic_mastery). Sums are
+    stored rather than means so that stack totals can be rolled up exactly."""
+
+    __tablename__ = "topic_mastery"
+
+    topic_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("topics.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    stack_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("study_stacks.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    flashcard_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    # Cards with a flashcard_stats row, i.e. reviewed at least once
+    reviewed_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    ease_sum: Mapped[float] = mapped_column(nullable=False, default=0.0)
+    ewma_miss_sum: Mapped[float] = mapped_column(nullable=False, default=0.0)
+    ewma_miss_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    # Scored answers to exam questions on this topic, and how many earned credit
+    answered_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    correct_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), onupdate=func.now()
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, List, Optional
 import uuid
 from datetime import datetime
 
@@ -15,6 +15,20 @@ class FlashcardSchema(BaseModel):
         from_attributes = True
 
 
+class FlashcardStatsSchema(BaseModel):
+    flashcard_id: uuid.UUID
+    correct_count: int
+    wrong_count: int
+    last_seen: Optional[datetime]
+    ease: float
+    interval_days: int
+    due_date: Optional[datetime]
+    ewma_miss: Optional[float]
+
+    class Config:
+        from_attributes = True
+
+
 class TopicDependencySchema(BaseModel):
     from_topic_id: uuid.UUID
     to_topic_id: uuid.UUID
@@ -48,6 +62,62 @@ class StudyStackSchema(BaseModel):
         from_attributes = True
 
 
+class TopicSummarySchema(BaseModel):
+    id: uuid.UUID
+    stack_id: uuid.UUID
+    name: str
+    description: Optional[str]
+    flashcard_count: int
+    due_count: int
+
+
+class StudyStackSummarySchema(BaseModel):
+    id: uuid.UUID
+    user_id: uuid.UUID
+    name: str
+    description: Optional[str]
+    topic_count: int
+    flashcard_count: int
+    due_count: int
+
+
+class TopicGraphSchema(BaseModel):
+    order: List[uuid.UUID]  # study order, prerequisites first
+    levels: dict[uuid.UUID, Optional[int]]  # None for topics behind a cycle
+    cycles: List[List[uuid.UUID]]
+
+
+class TopicClosureSchema(BaseModel):
+    topic_id: uuid.UUID
+    level: Optional[int]
+    prerequisites: List[uuid.UUID]  # transitive, in study order
+    dependents: List[uuid.UUID]  # transitive, in study order
+
+
+class TopicMasterySchema(BaseModel):
+    topic_id: uuid.UUID
+    name: str
+    flashcard_count: int
+    reviewed_count: int
+    due_count: int
+    mean_ease: Optional[float]  # over reviewed cards
+    mean_ewma_miss: Optional[float]
+    answered_count: int  # scored exam answers on the topic
+    exam_accuracy: Optional[float]
+
+
+class StackMasterySchema(BaseModel):
+    stack_id: uuid.UUID
+    flashcard_count: int
+    reviewed_count: int
+    due_count: int
+    mean_ease: Optional[float]
+    mean_ewma_miss: Optional[float]
+    answered_count: int
+    exam_accuracy: Optional[float]
+    topics: List[TopicMasterySchema]
+
+
 class UserSchema(BaseModel):
     id: uuid.UUID
     firebase_uid: str
@@ -162,3 +232,17 @@ class ChatSessionSchema(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class GenerationJobSchema(BaseModel):
+    id: uuid.UUID
+    kind: str
+    status: str  # "queued" | "running" | "succeeded" | "failed"
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,243 @@
+import heapq
+import os
+import threading
+import uuid
+from dataclasses import dataclass, field
+from cachetools import TTLCache
+
+# In-memory operations on a stack's topic graph. Nodes are topic ids and an
+# edge (from_id, to_id) means `from` is a prerequisite of `to`. Nothing here
+# touches the database; crud loads the stored graph, calls in and applies the
+# result with bulk statements.
+
+TOPIC_GRAPH_CACHE_SIZE = int(os.getenv("TOPIC_GRAPH_CACHE_SIZE", "1024"))
+# Writes invalidate the cache of the worker that made them; the TTL bounds
+# how stale other workers' copies can get
+TOPIC_GRAPH_CACHE_TTL_SECONDS = int(os.getenv("TOPIC_GRAPH_CACHE_TTL_SECONDS", "60"))
+
+Edge = tuple[uuid.UUID, uuid.UUID]
+
+
+@dataclass
+class GraphDiff:
+    new_topics: list[tuple[str, str | None]] = field(default_factory=list)
+    updated_topics: dict[uuid.UUID, tuple[str, str | None]] = field(
+        default_factory=dict
+    )
+    deleted_topic_ids: set[uuid.UUID] = field(default_factory=set)
+    new_edges: set[Edge] = field(default_factory=set)
+    deleted_edges: set[Edge] = field(default_factory=set)
+    # Submitted edges that do not join two kept topics of the stack
+    rejected_edges: set[Edge] = field(default_factory=set)
+
+
+def diff_graph(
+    stored_topics: dict[uuid.UUID, tuple[str, str | None]],
+    stored_edges: set[Edge],
+    topics: list[tuple[uuid.UUID | None, str, str | None]],
+    edges: set[Edge],
+) -> GraphDiff:
+    """Delta that turns the stored graph into the submitted one. `topics` is
+    the full submitted node list as (id, name, description), with id None for
+    topics to create; stored topics missing from it are deleted. `edges` is
+    the full submitted edge set. Runs in O(nodes + edges)."""
+    diff = GraphDiff()
+    kept = set()
+    for topic_id, name, description in topics:
+        if topic_id is None:
+            diff.new_topics.append((name, description))
+        elif topic_id in stored_topics:
+            kept.add(topic_id)
+            if stored_topics[topic_id] != (name, description):
+                diff.updated_topics[topic_id] = (name, description)
+        else:
+            raise ValueError("Topic not found or does not belong to stack")
+    diff.deleted_topic_ids = set(stored_topics) - kept
+
+    for edge in edges:
+        if edge[0] in kept and edge[1] in kept and edge[0] != edge[1]:
+            if edge not in stored_edges:
+                diff.new_edges.add(edge)
+        else:
+            diff.rejected_edges.add(edge)
+    # Edges touching deleted topics go with them through ON DELETE CASCADE
+    diff.deleted_edges = {
+        edge for edge in stored_edges - edges if edge[0] in kept and edge[1] in kept
+    }
+    return diff
+
+
+def _adjacency(edges) -> dict[uuid.UUID, set[uuid.UUID]]:
+    adjacency = {}
+    for from_id, to_id in edges:
+        adjacency.setdefault(from_id, set()).add(to_id)
+    return adjacency
+
+
+def _reaches(adjacency, start: uuid.UUID, target: uuid.UUID) -> bool:
+    stack, seen = [start], {start}
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        for next_node in adjacency.get(node, ()):
+            if next_node not in seen:
+                seen.add(next_node)
+                stack.append(next_node)
+    return False
+
+
+def add_acyclic_edges(
+    existing_edges: set[Edge], candidate_edges: list[Edge]
+) -> tuple[list[Edge], list[Edge]]:
+    """Accept candidates in order, skipping duplicates and any edge that would
+    close a cycle with the edges accepted so far. Returns (accepted, rejected)
+    where rejected holds the self-loops and cycle-closing edges."""
+    adjacency = _adjacency(existing_edges)
+    accepted, rejected = [], []
+    for edge in candidate_edges:
+        from_id, to_id = edge
+        if to_id in adjacency.get(from_id, ()):
+            continue
+        # from -> to closes a cycle iff `to` already reaches `from`
+        if from_id == to_id or _reaches(adjacency, to_id, from_id):
+            rejected.append(edge)
+            continue
+        adjacency.setdefault(from_id, set()).add(to_id)
+        accepted.append(edge)
+    return accepted, rejected
+
+
+class TopicGraph:
+    """Analytics over one stack's prerequisite graph, computed once when the
+    graph is built. `order` is a topological study order (prerequisites
+    first, ties broken by name); topics in or downstream of a cycle cannot
+    be ordered and follow at the end, with `level` None. `level` is the
+    length of the longest prerequisite chain leading to a topic."""
+
+    def __init__(self, names: dict[uuid.UUID, str], edges: set[Edge]):
+        self.names = names
+        self.edges = {e for e in edges if e[0] in names and e[1] in names}
+        self._children = {id: set() for id in names}
+        self._parents = {id: set() for id in names}
+        for from_id, to_id in self.edges:
+            self._children[from_id].add(to_id)
+            self._parents[to_id].add(from_id)
+        self.order, self.levels = self._topological_order()
+        self.cycles = self._find_cycles()
+        self._closures = {}
+        self._lock = threading.Lock()
+
+    def _topological_order(self):
+        in_degree = {id: len(parents) for id, parents in self._parents.items()}
+        levels = {id: None for id in self.names}
+        ready = []
+        for id, degree in in_degree.items():
+            if degree == 0:
+                levels[id] = 0
+                heapq.heappush(ready, (self.names[id], id))
+        order = []
+        while ready:
+            _, id = heapq.heappop(ready)
+            order.append(id)
+            for child in self._children[id]:
+                levels[child] = max(levels[child] or 0, levels[id] + 1)
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    heapq.heappush(ready, (self.names[child], child))
+        placed = set(order)
+        for id in sorted(self.names, key=lambda id: (self.names[id], id)):
+            if id not in placed:
+                order.append(id)
+                levels[id] = None
+        return order, levels
+
+    def _find_cycles(self) -> list[list[uuid.UUID]]:
+        """Strongly connected components with more than one topic (or a
+        self-loop), via an iterative Tarjan's algorithm."""
+        index, lowlink, on_stack = {}, {}, set()
+        stack, cycles, counter = [], [], 0
+        for root in self.names:
+            if root in index:
+                continue
+            work = [(root, iter(self._children[root]))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is None:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in self._children[node]:
+                            cycles.append(component)
+                elif child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(self._children[child])))
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+        return cycles
+
+    def _closure(self, topic_id: uuid.UUID, adjacency, kind: str) -> set[uuid.UUID]:
+        key = (kind, topic_id)
+        with self._lock:
+            if key in self._closures:
+                return self._closures[key]
+        seen, stack = set(), [topic_id]
+        while stack:
+            for next_id in adjacency[stack.pop()]:
+                if next_id not in seen:
+                    seen.add(next_id)
+                    stack.append(next_id)
+        seen.discard(topic_id)
+        with self._lock:
+            self._closures[key] = seen
+        return seen
+
+    def prerequisites(self, topic_id: uuid.UUID) -> set[uuid.UUID]:
+        """Every topic that must be studied before `topic_id`."""
+        return self._closure(topic_id, self._parents, "prerequisites")
+
+    def dependents(self, topic_id: uuid.UUID) -> set[uuid.UUID]:
+        """Every topic that builds on `topic_id`."""
+        return self._closure(topic_id, self._children, "dependents")
+
+    def sort(self, topic_ids) -> list[uuid.UUID]:
+        """`topic_ids` in study order."""
+        position = {id: i for i, id in enumerate(self.order)}
+        return sorted(topic_ids, key=lambda id: position.get(id, len(position)))
+
+
+_cache = TTLCache(maxsize=TOPIC_GRAPH_CACHE_SIZE, ttl=TOPIC_GRAPH_CACHE_TTL_SECONDS)
+_cache_lock = threading.Lock()
+
+
+def get_cached(stack_id: uuid.UUID) -> TopicGraph | None:
+    with _cache_lock:
+        return _cache.get(stack_id)
+
+
+def cache_graph(stack_id: uuid.UUID, graph: TopicGraph):
+    with _cache_lock:
+        _cache[stack_id] = graph
+
+
+def invalidate(*stack_ids: uuid.UUID):
+    with _cache_lock:
+        for stack_id in stack_ids:
+            _cache.pop(stack_id, None)
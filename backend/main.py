@@ -1,13 +1,38 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+import anyio
+from fastapi import Depends, FastAPI
+from api import jobs, llm
 from api.routes.flashcard_routes import router as flashcard_router
 from api.routes.stack_routes import router as stack_router
 from api.routes.exam_routes import router as exam_router
 from api.routes.chat_routes import router as chat_router
-from db.database import engine
+from api.routes.job_routes import router as job_router
+from api.auth import get_auth_cache_stats, require_metrics_token
+from api.llm_cache import llm_cache
+from db import crud
+from db.database import SessionLocal, engine, get_pool_stats
 from db.models import Base
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+# Threads shared by plain `def` routes and run_in_threadpool offloads; each
+# one can hold a pooled DB connection, so size it together with the pool
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    await llm.start_client()
+    jobs.fail_stale_jobs()
+    llm_cache.purge_expired()
+    with SessionLocal() as db:
+        crud.backfill_topic_mastery(db)
+    yield
+    await llm.close_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,8 +47,18 @@ app.include_router(stack_router)
 app.include_router(flashcard_router)
 app.include_router(exam_router)
 app.include_router(chat_router)
+app.include_router(job_router)
 
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+def metrics():
+    return {
+        "auth_cache": get_auth_cache_stats(),
+        "llm_cache": llm_cache.get_stats(),
+        "db_pool": get_pool_stats(),
+    }
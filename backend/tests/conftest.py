@@ -0,0 +1,114 @@
+import firebase_admin
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# api.auth initializes Firebase from a service account key on import unless an
+# app already exists; tests never verify real tokens, so any app will do
+if not firebase_admin._apps:
+    firebase_admin.initialize_app(options={"projectId": "test"})
+
+from api.auth import AuthenticatedUser, get_current_user
+from db import crud
+from db.database import get_db
+from db.models import Base, Flashcard, StudyStack, Topic, User
+
+# Tests run against an in-memory SQLite database rather than Postgres.
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    event.listen(
+        engine, "connect", lambda conn, _: conn.execute("PRAGMA foreign_keys=ON")
+    )
+    Base.metadata.create_all(engine)
+    # INSERT .. ON CONFLICT is spelled the same on SQLite
+    monkeypatch.setattr(crud, "pg_insert", sqlite_insert)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+
+@pytest.fixture
+def db(session_factory):
+    with session_factory() as db:
+        yield db
+
+
+@pytest.fixture
+def statements(engine):
+    """Every SQL statement executed on the engine from now on."""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    return executed
+
+
+@pytest.fixture
+def user(db):
+    user = User(firebase_uid="test-user", name="Test User")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def make_stack(db, user):
+    """Create a stack with `topics` topics of `cards` flashcards each."""
+
+    def make(topics: int, cards: int) -> StudyStack:
+        stack = StudyStack(user_id=user.id, name="Stack", description="")
+        db.add(stack)
+        db.flush()
+        for i in range(topics):
+            topic = Topic(stack_id=stack.id, name=f"Topic {i}", description="")
+            db.add(topic)
+            db.flush()
+            db.add_all(
+                Flashcard(topic_id=topic.id, front=f"Front {i}.{j}", back="Back")
+                for j in range(cards)
+            )
+        db.commit()
+        return stack
+
+    return make
+
+
+@pytest.fixture
+def make_client(session_factory, user):
+    """TestClient for an app serving `routers`, authenticated as `user` and
+    backed by the test database."""
+
+    def make(*routers) -> TestClient:
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+
+        def override_get_db():
+            with session_factory() as db:
+                yield db
+
+        authenticated = AuthenticatedUser(
+            id=user.id, firebase_uid=user.firebase_uid, name=user.name
+        )
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_current_user] = lambda: authenticated
+        return TestClient(app)
+
+    return make
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from api import auth
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/metrics", dependencies=[Depends(auth.require_metrics_token)])
+    def metrics():
+        return {}
+
+    return TestClient(app)
+
+
+def test_metrics_are_disabled_without_a_token(monkeypatch, client):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", None)
+    assert client.get("/metrics").status_code == 404
+    assert (
+        client.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 404
+    )
+
+
+def test_metrics_require_the_token(monkeypatch, client):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "secret")
+    assert client.get("/metrics").status_code == 401
+    assert (
+        client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code
+        == 401
+    )
+    assert (
+        client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code
+        == 200
+    )
@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api import generation
+from api.auth import AuthenticatedUser, get_current_user
+from api.routes.stack_routes import router as stack_router
+from db.database import TimedQueuePool
+from db.models import Base, StudyStack, User
+
+POOL_SIZE = 1
+MAX_OVERFLOW = 1
+LLM_SECONDS = 0.5
+# Concurrent requests: three times the connections the pool can hand out
+REQUESTS = 3 * (POOL_SIZE + MAX_OVERFLOW)
+
+
+@pytest.fixture
+def small_pool(tmp_path, monkeypatch):
+    """A file database behind a pool with too few connections for one per
+    in-flight request, wired into the generation module."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        # A request holding its connection across the LLM call would keep
+        # the others waiting for at least a full call
+        pool_timeout=LLM_SECONDS,
+    )
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(
+        generation, "SessionLocal", sessionmaker(bind=engine, autoflush=False)
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_llm_calls_do_not_hold_connections(small_pool, monkeypatch):
+    with sessionmaker(bind=small_pool)() as db:
+        user = User(firebase_uid="test-user", name="Test User")
+        db.add(user)
+        db.flush()
+        stacks = [
+            StudyStack(user_id=user.id, name=f"Stack {i}", description="")
+            for i in range(REQUESTS)
+        ]
+        db.add_all(stacks)
+        db.commit()
+        authenticated = AuthenticatedUser(
+            id=user.id, firebase_uid=user.firebase_uid, name=user.name
+        )
+        stack_ids = [stack.id for stack in stacks]
+
+    async def slow_extract_topics(stack_name, stack_description, avoid_topics):
+        await asyncio.sleep(LLM_SECONDS)
+        return {"topics": {f"{stack_name} topic": "Description"}}
+
+    monkeypatch.setattr(generation, "extract_topics", slow_extract_topics)
+
+    app = FastAPI()
+    app.include_router(stack_router)
+    app.dependency_overrides[get_current_user] = lambda: authenticated
+
+    async def generate_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(
+                *(
+                    client.post(f"/stacks/{stack_id}/generate_topics")
+                    for stack_id in stack_ids
+                )
+            )
+
+    responses = asyncio.run(generate_all())
+
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+    assert small_pool.pool.wait_stats()["timeouts"] == 0
@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from db.database import TimedQueuePool
+
+
+def test_timed_pool_counts_checkouts_and_timeouts():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    with engine.connect():
+        # The only connection is checked out
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    with engine.connect():
+        pass
+
+    stats = engine.pool.wait_stats()
+    assert stats["checkouts"] == 3
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_seconds"] >= 0.1
+    engine.dispose()
@@ -0,0 +1,68 @@
+from api.routes.exam_routes import router as exam_router
+from db import crud
+from db.models import Question, QuestionAttempt, Topic
+
+
+def _question(topic_name):
+    return {
+        "text": "Q",
+        "option_a": "A",
+        "option_b": "B",
+        "option_c": "C",
+        "option_d": "D",
+        "answer": "A",
+        "topic_name": topic_name,
+    }
+
+
+def test_exam_questions_with_non_string_topic_names_have_no_topic(db, user, make_stack):
+    stack = make_stack(topics=1, cards=0)
+    stack_id, user_id = stack.id, user.id
+    topic_id = db.query(Topic.id).scalar()
+
+    exam = crud.create_exam_with_questions(
+        db,
+        stack_id,
+        "Exam",
+        [_question("Topic 0"), _question(["Topic 0"]), _question({"a": 1})],
+        user_id,
+    )
+
+    question_topic_ids = [
+        id
+        for (id,) in db.query(Question.topic_id)
+        .filter(Question.exam_id == exam.id)
+        .order_by(Question.order)
+    ]
+    assert question_topic_ids == [topic_id, None, None]
+
+
+def test_scoring_update_validates_question_attempts(db, user, make_stack, make_client):
+    stack = make_stack(topics=1, cards=0)
+    stack_id, user_id = stack.id, user.id
+    exam = crud.create_exam_with_questions(
+        db, stack_id, "Exam", [_question("Topic 0")], user_id
+    )
+    question_id = db.query(Question.id).filter(Question.exam_id == exam.id).scalar()
+    attempt = crud.create_graded_exam_attempt(
+        db, exam.id, [{"question_id": question_id, "selected_option": "B"}], user_id
+    )
+    attempt_id = attempt.id
+    question_attempt_id = db.query(QuestionAttempt.id).scalar()
+    client = make_client(exam_router)
+    path = f"/exams/attempt/{attempt_id}/update_scoring"
+
+    missing_key = {"question_attempt_id": str(question_attempt_id), "scored": True}
+    response = client.post(path, json={"question_attempts": [missing_key]})
+    assert response.status_code == 422
+
+    change = {
+        "question_attempt_id": str(question_attempt_id),
+        "scored": "false",
+        "manual_credit": "true",
+    }
+    response = client.post(path, json={"question_attempts": [change]})
+    assert response.status_code == 200
+    db.expire_all()
+    question_attempt = db.get(QuestionAttempt, question_attempt_id)
+    assert (question_attempt.scored, question_attempt.manual_credit) == (False, True)
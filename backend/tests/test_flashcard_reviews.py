@@ -0,0 +1,45 @@
+from api.routes.flashcard_routes import MAX_BATCH_REVIEWS, router as flashcard_router
+from db.models import Flashcard, FlashcardReview
+
+
+def _submit_batch(client, db, stack, statements):
+    card_ids = [
+        str(card_id)
+        for (card_id,) in db.query(Flashcard.id)
+        .join(Flashcard.topic)
+        .filter_by(stack_id=stack.id)
+    ]
+    reviews = [
+        {"flashcard_id": card_id, "grade": 5 if i % 2 else 1}
+        for i, card_id in enumerate(card_ids)
+    ]
+    statements.clear()
+    response = client.post("/flashcards/reviews/batch", json={"reviews": reviews})
+    assert response.status_code == 200
+    return card_ids, response.json(), len(statements)
+
+
+def test_batch_review_endpoint_runs_a_constant_number_of_statements(
+    db, make_stack, make_client, statements
+):
+    client = make_client(flashcard_router)
+    small = make_stack(topics=1, cards=3)
+    large = make_stack(topics=3, cards=3)
+
+    _, _, small_count = _submit_batch(client, db, small, statements)
+    card_ids, stats, large_count = _submit_batch(client, db, large, statements)
+
+    assert large_count == small_count
+    assert sorted(s["flashcard_id"] for s in stats) == sorted(card_ids)
+    assert {(s["correct_count"], s["wrong_count"]) for s in stats} == {(0, 1), (1, 0)}
+
+
+def test_batch_review_endpoint_rejects_oversized_batches(db, make_stack, make_client):
+    client = make_client(flashcard_router)
+    card_id = str(make_stack(topics=1, cards=1).topics[0].flashcards[0].id)
+    reviews = [{"flashcard_id": card_id, "grade": 5}] * (MAX_BATCH_REVIEWS + 1)
+
+    response = client.post("/flashcards/reviews/batch", json={"reviews": reviews})
+
+    assert response.status_code == 422
+    assert db.query(FlashcardReview).count() == 0
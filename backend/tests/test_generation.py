@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+from api import generation
+from db.models import Flashcard, Topic
+
+
+@pytest.fixture
+def generation_db(monkeypatch, session_factory):
+    monkeypatch.setattr(generation, "SessionLocal", session_factory)
+
+
+def test_stack_generation_skips_incomplete_cards(
+    monkeypatch, generation_db, db, user, make_stack
+):
+    stack = make_stack(topics=3, cards=0)
+    names = {topic.name: topic.id for topic in db.query(Topic)}
+
+    async def fake_extract_flashcards(topic_name, num_cards=10, avoid_fronts=()):
+        if topic_name == "Topic 0":
+            return [
+                {"front": "Q", "back": "A", "explanation": "E"},
+                {"front": "Q without an answer"},
+            ]
+        if topic_name == "Topic 1":
+            raise ValueError("bad response")
+        return [{"front": "Q", "back": "A", "explanation": "E"}]
+
+    monkeypatch.setattr(generation, "extract_flashcards", fake_extract_flashcards)
+    results = asyncio.run(generation.generate_stack_flashcards(stack.id, user.id))
+
+    by_name = {result["topic_name"]: result for result in results}
+    assert by_name["Topic 0"]["created"] == 1
+    assert by_name["Topic 1"] == {
+        "topic_id": names["Topic 1"],
+        "topic_name": "Topic 1",
+        "created": 0,
+        "error": "bad response",
+    }
+    assert by_name["Topic 2"]["created"] == 1
+    assert db.query(Flashcard).count() == 2
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from api import jobs
+from db import crud
+from db.models import GenerationJob
+
+
+@pytest.fixture
+def make_job(db, user):
+    user_id = user.id
+
+    def make(status: str, created_ago: int = 0, started_ago: int | None = None):
+        now = datetime.now(timezone.utc)
+        job = GenerationJob(
+            user_id=user_id,
+            kind="topics",
+            params={},
+            status=status,
+            created_at=now - timedelta(seconds=created_ago),
+            started_at=(
+                now - timedelta(seconds=started_ago)
+                if started_ago is not None
+                else None
+            ),
+        )
+        db.add(job)
+        db.commit()
+        return job.id
+
+    return make
+
+
+def _status(db, job_id):
+    db.expire_all()
+    return db.get(GenerationJob, job_id).status
+
+
+def test_transitions_skip_finalized_jobs(db, make_job):
+    job_id = make_job("queued")
+    assert crud.mark_job_running(db, job_id)
+    assert not crud.mark_job_running(db, job_id)
+
+    assert crud.finish_job(db, job_id, error="boom")
+    # A late result must not overwrite the failure
+    assert not crud.finish_job(db, job_id, result={"ok": True})
+    db.expire_all()
+    job = db.get(GenerationJob, job_id)
+    assert (job.status, job.error, job.result) == ("failed", "boom", None)
+
+    assert not crud.mark_job_running(db, job_id)
+    assert _status(db, job_id) == "failed"
+
+
+def test_staleness_measured_from_start(db, make_job, monkeypatch):
+    monkeypatch.setattr(jobs, "SessionLocal", lambda: db)
+    timeout = jobs.JOB_TIMEOUT_SECONDS + jobs.JOB_STALE_GRACE_SECONDS
+    # Queued long ago but only just started: still within its timeout
+    recently_started = make_job("running", created_ago=10 * timeout, started_ago=1)
+    lost = make_job("running", created_ago=timeout + 10, started_ago=timeout + 1)
+    # Waiting behind the user's other jobs is not stale
+    queued = make_job("queued", created_ago=timeout + 10)
+
+    assert jobs.fail_stale_jobs() == 1
+    assert _status(db, recently_started) == "running"
+    assert _status(db, lost) == "failed"
+    assert _status(db, queued) == "queued"
+
+
+def test_jobs_owned_by_this_process_are_never_stale(db, make_job, monkeypatch):
+    monkeypatch.setattr(jobs, "SessionLocal", lambda: db)
+    long_ago = 100 * (jobs.JOB_TIMEOUT_SECONDS + jobs.JOB_STALE_GRACE_SECONDS)
+    local = make_job("queued", created_ago=long_ago)
+    orphaned = make_job("queued", created_ago=long_ago)
+    monkeypatch.setattr(jobs, "_local_jobs", {local})
+
+    assert jobs.fail_stale_jobs() == 1
+    assert _status(db, local) == "queued"
+    assert _status(db, orphaned) == "failed"
+
+
+def test_create_job_refuses_jobs_over_the_cap(db, user, make_job):
+    user_id = user.id
+    make_job("queued")
+    make_job("running")
+    make_job("succeeded")
+
+    assert crud.create_job(db, user_id, "topics", {}, max_active=2) is None
+    job = crud.create_job(db, user_id, "topics", {}, max_active=3)
+    assert job.status == "queued"
+    assert crud.count_active_jobs(db, user_id) == 3
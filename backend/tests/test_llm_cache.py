@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from api import llm_cache as llm_cache_module
+from api.llm_cache import LLMCache
+from db.models import LLMCacheEntry
+
+
+@pytest.fixture
+def cache(monkeypatch, session_factory):
+    monkeypatch.setattr(llm_cache_module, "SessionLocal", session_factory)
+    monkeypatch.setattr(llm_cache_module, "insert", sqlite_insert)
+    return LLMCache(maxsize=8, ttl=60, use_db=True, purge_batch=2)
+
+
+def _add_entries(db, prefix: str, count: int, expires_at: datetime):
+    db.add_all(
+        LLMCacheEntry(key=f"{prefix}{i}", response={}, expires_at=expires_at)
+        for i in range(count)
+    )
+    db.commit()
+
+
+def test_store_deletes_a_bounded_batch_of_expired_rows(cache, db):
+    now = datetime.now(timezone.utc)
+    _add_entries(db, "expired", 3, now - timedelta(seconds=1))
+    _add_entries(db, "live", 2, now + timedelta(hours=1))
+
+    asyncio.run(cache.set("new", {"choices": []}))
+
+    keys = {key for (key,) in db.query(LLMCacheEntry.key)}
+    assert len(keys & {"expired0", "expired1", "expired2"}) == 1
+    assert {"live0", "live1", "new"} <= keys
+
+
+def test_purge_expired_deletes_every_expired_row(cache, db):
+    now = datetime.now(timezone.utc)
+    _add_entries(db, "expired", 5, now - timedelta(seconds=1))
+    _add_entries(db, "live", 1, now + timedelta(hours=1))
+
+    assert cache.purge_expired() == 5
+    assert [key for (key,) in db.query(LLMCacheEntry.key)] == ["live0"]
@@ -0,0 +1,60 @@
+from api import generation
+from db import crud
+from db.models import Topic, TopicMastery
+
+
+def _writes(statements):
+    return [
+        s for s in statements if s.split(None, 1)[0] in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def test_get_is_read_only(db, user, make_stack, statements):
+    # Rows made directly, like topics that predate topic_mastery
+    stack = make_stack(topics=2, cards=3)
+    stack_id, user_id = stack.id, user.id
+    crud.create_topic(db, stack_id, "Stored", None, user_id)
+    statements.clear()
+
+    mastery = crud.get_stack_mastery(db, stack_id, user_id)
+
+    assert _writes(statements) == []
+    assert db.query(TopicMastery).count() == 1
+    assert mastery["flashcard_count"] == 6
+    assert mastery["due_count"] == 6
+    assert [topic["flashcard_count"] for topic in mastery["topics"]] == [0, 3, 3]
+    assert [topic["mean_ease"] for topic in mastery["topics"]] == [None] * 3
+
+    assert crud.backfill_topic_mastery(db) == 2
+    assert crud.get_stack_mastery(db, stack_id, user_id) == mastery
+
+
+def test_topic_writes_create_mastery_rows(db, user, make_stack):
+    stack = make_stack(topics=0, cards=0)
+    stack_id, user_id = stack.id, user.id
+    crud.create_topic(db, stack_id, "Single", None, user_id)
+    crud.save_topic_list(db, stack_id, user_id, {"A": "", "B": ""}, {}, [])
+
+    assert db.query(TopicMastery).count() == 3
+
+
+def test_generated_flashcards_refresh_mastery_once(
+    monkeypatch, session_factory, db, user, make_stack, statements
+):
+    monkeypatch.setattr(generation, "SessionLocal", session_factory)
+    make_stack(topics=1, cards=0)
+    topic_id, user_id = db.query(Topic.id).scalar(), user.id
+    cards = [{"front": f"Q{i}", "back": "A", "explanation": "E"} for i in range(5)]
+    statements.clear()
+
+    created = generation._save_flashcards(topic_id, user_id, cards)
+
+    refreshes = [s for s in statements if s.startswith("INSERT INTO topic_mastery")]
+    assert len(refreshes) == 1
+    assert [card.front for card in created] == [f"Q{i}" for i in range(5)]
+    assert (
+        crud.get_stack_mastery(db, db.get(Topic, topic_id).stack_id, user_id)[
+            "flashcard_count"
+        ]
+        == 5
+    )
@@ -0,0 +1,34 @@
+import pytest
+from db import crud
+from db.models import Flashcard, FlashcardStats, StudyStack, TopicDependency, User
+
+
+def test_owned_helpers_use_the_models_primary_key(db, user, make_stack):
+    make_stack(topics=1, cards=2)
+    card_ids = [card_id for (card_id,) in db.query(Flashcard.id)]
+    db.add_all(FlashcardStats(flashcard_id=card_id) for card_id in card_ids)
+    db.commit()
+
+    stats = crud.get_owned(db, FlashcardStats, card_ids[0], user.id)
+    assert stats.flashcard_id == card_ids[0]
+    assert len(crud.get_owned_many(db, FlashcardStats, card_ids, user.id)) == 2
+    assert crud.verify_owned_ids(db, FlashcardStats, card_ids, user.id)
+
+
+def test_owned_helpers_reject_other_users_rows(db, user, make_stack):
+    make_stack(topics=1, cards=1)
+    other = User(firebase_uid="other-user", name="Other")
+    db.add(other)
+    db.commit()
+    (card_id,) = db.query(Flashcard.id).one()
+
+    with pytest.raises(ValueError):
+        crud.get_owned(db, Flashcard, card_id, other.id)
+    with pytest.raises(ValueError):
+        crud.verify_owned_ids(db, Flashcard, [card_id], other.id)
+    assert crud.get_owned(db, StudyStack, db.query(StudyStack.id).scalar(), user.id)
+
+
+def test_owned_helpers_refuse_composite_keys(db, user):
+    with pytest.raises(TypeError):
+        crud.get_owned(db, TopicDependency, None, user.id)
@@ -0,0 +1,96 @@
+import pytest
+from api.routes.stack_routes import router as stack_router
+from db import crud
+from db.models import Topic, TopicDependency
+from db.schemas import StudyStackSchema, TopicSchema
+
+
+@pytest.fixture
+def make_tree(db, make_stack):
+    """A stack whose topics form a prerequisite chain."""
+
+    def make(topics: int, cards: int):
+        stack = make_stack(topics=topics, cards=cards)
+        topic_ids = [
+            topic_id
+            for (topic_id,) in db.query(Topic.id)
+            .filter(Topic.stack_id == stack.id)
+            .order_by(Topic.name)
+        ]
+        db.add_all(
+            TopicDependency(from_topic_id=from_id, to_topic_id=to_id)
+            for from_id, to_id in zip(topic_ids, topic_ids[1:])
+        )
+        db.commit()
+        return stack.id
+
+    return make
+
+
+def _count(session_factory, statements, load):
+    # A fresh session each time, so nothing is served from the identity map
+    with session_factory() as db:
+        statements.clear()
+        load(db)
+        return len(statements)
+
+
+def test_stack_tree_loads_in_a_bounded_number_of_statements(
+    session_factory, user, make_tree, statements
+):
+    small = make_tree(topics=1, cards=1)
+    large = make_tree(topics=12, cards=8)
+    user_id = user.id
+
+    def load_stack(stack_id):
+        return lambda db: StudyStackSchema.model_validate(
+            crud.get_stack_tree_by_id(db, stack_id, user_id)
+        )
+
+    small_count = _count(session_factory, statements, load_stack(small))
+    large_count = _count(session_factory, statements, load_stack(large))
+    assert large_count == small_count
+    assert large_count <= 5
+
+
+def test_topic_tree_loads_in_a_bounded_number_of_statements(
+    session_factory, user, make_tree, statements
+):
+    small = make_tree(topics=1, cards=1)
+    large = make_tree(topics=12, cards=8)
+    user_id = user.id
+
+    def load_topics(stack_id):
+        return lambda db: [
+            TopicSchema.model_validate(topic)
+            for topic in crud.get_topics_by_stack_id(db, stack_id, user_id)
+        ]
+
+    small_count = _count(session_factory, statements, load_topics(small))
+    large_count = _count(session_factory, statements, load_topics(large))
+    assert large_count == small_count
+    assert large_count <= 5
+
+
+def test_stack_list_endpoint_runs_a_constant_number_of_statements(
+    make_client, make_tree, statements
+):
+    client = make_client(stack_router)
+
+    def list_stacks(expected):
+        statements.clear()
+        response = client.get("/stacks")
+        assert response.status_code == 200
+        assert len(response.json()) == expected
+        return len(statements)
+
+    n = 2
+    for _ in range(n):
+        make_tree(topics=3, cards=2)
+    small_count = list_stacks(n)
+    for _ in range(2 * n):
+        make_tree(topics=3, cards=2)
+    large_count = list_stacks(3 * n)
+
+    assert large_count == small_count
+    assert large_count <= 5
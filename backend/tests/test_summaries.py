@@ -0,0 +1,25 @@
+from db import crud
+from db.models import StudyStack, Topic, User
+
+
+def test_stack_summaries_count_only_the_users_stacks(db, user, make_stack):
+    stack = make_stack(topics=2, cards=3)
+    make_stack(topics=0, cards=0)
+    other = User(firebase_uid="other-user", name="Other")
+    db.add(other)
+    db.flush()
+    other_stack = StudyStack(user_id=other.id, name="Theirs", description="")
+    db.add(other_stack)
+    db.flush()
+    db.add(Topic(stack_id=other_stack.id, name="Their topic"))
+    db.commit()
+
+    summaries = {s["id"]: s for s in crud.get_stack_summaries_by_user_id(db, user.id)}
+
+    assert len(summaries) == 2
+    assert summaries[stack.id]["topic_count"] == 2
+    assert summaries[stack.id]["flashcard_count"] == 6
+    # Never-reviewed cards are due
+    assert summaries[stack.id]["due_count"] == 6
+    empty = next(s for id, s in summaries.items() if id != stack.id)
+    assert (empty["topic_count"], empty["flashcard_count"]) == (0, 0)
@@ -0,0 +1,22 @@
+from db import crud
+from db.models import TopicDependency
+
+
+def test_dependencies_with_non_string_names_are_skipped(db, user, make_stack):
+    stack = make_stack(topics=3, cards=0)
+    stack_id, user_id = stack.id, user.id
+
+    accepted = crud.add_topic_dependencies_by_name(
+        db,
+        stack_id,
+        user_id,
+        [
+            ["Topic 0", "Topic 1"],
+            [["Topic 1"], "Topic 2"],
+            ["Topic 1", {"name": "Topic 2"}],
+            ["Topic 0", "Unknown"],
+        ],
+    )
+
+    assert len(accepted) == 1
+    assert db.query(TopicDependency).count() == 1
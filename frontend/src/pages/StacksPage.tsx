@@ -44,7 +44,7 @@ export default function StacksPage() {
     const fetchStacks = async () => {
       try {
         setLoading(true);
-        const res = await api.get("/stacks");
+        const res = await api.get("/stacks/summary");
         console.log("stackList:", res.data);
         setStacks(res.data);
       } catch (error) {